@@ -0,0 +1,206 @@
+"""图片压缩的回归测试: 调色板、1位等特殊模式图片，探针预测和缓存"""
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+
+from PIL import Image, ImageFilter
+
+from 压缩基准测试 import make_photo
+from 图片压缩 import (CompressionCache, Tracer, collect_images, compress_image, encode_image, open_image, run_cli,
+                  search_quality)
+
+
+def noise_image(path, mode, size=(600, 500)):
+    img = Image.effect_noise(size, 90).convert('RGB')
+    img = img.quantize(256) if mode == 'P' else img.convert(mode)
+    img.save(path)
+    return str(path)
+
+
+def test_open_image_reduces_palette_and_bilevel(tmp_path):
+    for mode, name in (('P', 'palette.gif'), ('1', 'bilevel.png')):
+        img, _, scale = open_image(noise_image(tmp_path / name, mode), scale=0.25)
+        assert scale <= 0.5
+        assert img.width < 600
+
+
+def test_max_memory_on_palette_gif(tmp_path):
+    source = noise_image(tmp_path / 'palette.gif', 'P')
+    stats = {}
+    success, message = compress_image(source, str(tmp_path / 'out.gif'), target_kb=200, max_memory_mb=0.1,
+                                      stats=stats)
+    assert success, message
+    assert os.path.getsize(stats['output']) <= 200 * 1024
+
+
+def test_palette_gif_needs_resize(tmp_path):
+    # 调色板档位降到最低仍然超出目标，需要缩小尺寸
+    source = noise_image(tmp_path / 'palette.gif', 'P')
+    stats = {}
+    success, message = compress_image(source, str(tmp_path / 'out.gif'), target_kb=20, stats=stats)
+    assert success, message
+    assert stats['scale'] < 1
+    assert os.path.getsize(stats['output']) <= 20 * 1024
+
+
+def test_predictor_skipped_when_max_quality_fits(tmp_path):
+    # 最高质量已满足时只编码一次，不建探针
+    source = str(tmp_path / 'photo.png')
+    Image.effect_noise((1200, 1000), 20).convert('RGB').save(source)
+    stats = {}
+    success, message = compress_image(source, str(tmp_path / 'out.jpg'), target_kb=1500, stats=stats)
+    assert success, message
+    assert stats['trials'] == 1
+    assert stats['predictions'] == []
+
+
+def test_probe_encodes_counted_in_trials(tmp_path):
+    source = str(tmp_path / 'photo.png')
+    Image.effect_noise((1200, 1000), 90).convert('RGB').save(source)
+    stats = {}
+    success, message = compress_image(source, str(tmp_path / 'out.jpg'), target_kb=100, stats=stats)
+    assert success, message
+    assert stats['predictions']
+    assert stats['trials'] > len(stats['predictions'])
+
+
+def test_cache_put_scans_rarely_and_respects_limit(tmp_path, monkeypatch):
+    cache = CompressionCache(str(tmp_path / 'cache'), max_mb=1)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, 'evict', lambda: scans.append(1) or evict())
+    for i in range(300):
+        cache.put(f"{i:064x}", {'quality': i}, bytes(10000))
+    total = sum(path.stat().st_size for path in (tmp_path / 'cache').rglob('*') if path.is_file())
+    assert total <= 1024 * 1024
+    # 第一次写入扫描一次，之后只在估计值超过上限时扫描
+    assert len(scans) < 20
+
+
+def test_auto_format_prefers_smallest_file_at_same_scale(tmp_path):
+    # 无损 PNG 的质量记为 100，高于 JPEG/WebP 的质量，但不同格式的质量不可比较，缩放相同时选文件最小的
+    source = str(tmp_path / 'photo.bmp')
+    Image.effect_noise((800, 600), 40).convert('RGB').filter(ImageFilter.GaussianBlur(3)).save(source)
+    sizes = {}
+    for fmt in ('jpeg', 'png', 'webp'):
+        stats = {}
+        success, message = compress_image(source, str(tmp_path / f'out.{fmt}'), target_kb=200, stats=stats,
+                                          formats=[fmt])
+        assert success, message
+        assert stats['scale'] == 1.0
+        sizes[stats['format']] = stats['size']
+    stats = {}
+    success, message = compress_image(source, str(tmp_path / 'auto.bmp'), target_kb=200, stats=stats,
+                                      formats='auto')
+    assert success, message
+    assert stats['size'] == min(sizes.values())
+
+
+def test_second_directory_run_skips_outputs(tmp_path):
+    noise_image(tmp_path / 'a.png', 'RGB')
+    noise_image(tmp_path / 'b.gif', 'P')
+    assert run_cli([str(tmp_path), '-t', '200', '-j', '1']) == 0
+    first = sorted(path.name for path in tmp_path.iterdir())
+    assert first == ['a.png', 'a_compressed.png', 'b.gif', 'b_compressed.gif']
+    assert collect_images(str(tmp_path)) == [str(tmp_path / 'a.png'), str(tmp_path / 'b.gif')]
+    assert run_cli([str(tmp_path), '-t', '200', '-j', '1']) == 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == first
+
+
+def test_stdin_to_stdout_small_image(tmp_path):
+    # 已小于目标的图片从标准输入读取时，临时文件没有扩展名也要能按原格式写出
+    source = tmp_path / 'small.jpg'
+    Image.effect_noise((100, 100), 50).convert('RGB').save(source)
+    result = subprocess.run([sys.executable, '图片压缩.py', '-', '-o', '-', '-t', '200'],
+                            input=source.read_bytes(), capture_output=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.returncode == 0, result.stderr.decode('utf-8', 'replace')
+    assert Image.open(io.BytesIO(result.stdout)).format == 'JPEG'
+
+
+def test_batch_cli_passes_search_options(tmp_path, capsys):
+    # 多个文件时 --scale-min-quality、--no-predict 等参数同样要传给每个子进程
+    inputs = []
+    for name in ('a.jpg', 'b.jpg'):
+        path = tmp_path / name
+        Image.effect_noise((1400, 1000), 60).convert('RGB').save(path, quality=95)
+        inputs.append(str(path))
+    assert run_cli(inputs + ['-t', '40', '--max-quality', '95', '--scale-min-quality', '90', '--no-predict',
+                             '--json', '-j', '2']) == 0
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()][:-1]
+    assert len(results) == 2
+    for result in results:
+        assert result['scale'] < 1
+        assert result['quality'] >= 90
+        assert result['predictions'] == []
+
+
+def test_small_image_converted_to_requested_format(tmp_path):
+    # 已小于目标大小时也要按输出格式保存，RGBA、调色板图片转为 JPEG 前先转换模式
+    source = str(tmp_path / 'small.png')
+    Image.new('RGBA', (64, 64), (255, 0, 0, 128)).save(source)
+    stats = {}
+    success, message = compress_image(source, str(tmp_path / 'out.jpg'), target_kb=200, stats=stats)
+    assert success, message
+    assert Image.open(stats['output']).format == 'JPEG'
+
+    stats = {}
+    success, message = compress_image(noise_image(tmp_path / 'small.gif', 'P', (64, 64)),
+                                      str(tmp_path / 'out.png'), target_kb=200, stats=stats, formats=['jpeg'])
+    assert success, message
+    assert stats['output'] == str(tmp_path / 'out.jpg')
+    assert Image.open(stats['output']).format == 'JPEG'
+
+
+def test_small_image_copied_unchanged(tmp_path):
+    source = tmp_path / 'small.jpg'
+    Image.effect_noise((100, 100), 50).convert('RGB').save(source)
+    stats = {}
+    success, message = compress_image(str(source), str(tmp_path / 'out.jpg'), target_kb=200, stats=stats)
+    assert success, message
+    assert (tmp_path / 'out.jpg').read_bytes() == source.read_bytes()
+    assert stats['trials'] == 0
+
+
+def test_scale_search_stops_near_target(tmp_path):
+    # 满足要求的尺寸已接近目标大小时停止，不再回到二分把缩放比例放大到远超结果的位置
+    source = str(tmp_path / 'photo.jpg')
+    make_photo(random.Random(1), (3000, 2000)).save(source, quality=95)
+    for predict in (True, False):
+        stats, tracer = {}, Tracer()
+        success, message = compress_image(source, str(tmp_path / 'out.jpg'), target_kb=60, stats=stats,
+                                          predict=predict, tracer=tracer)
+        assert success, message
+        scales = [record['scale'] for record in tracer.records if record['stage'] == 'resize']
+        assert stats['scale'] < 1
+        assert max(scales) < stats['scale'] * 1.5
+        assert len(scales) <= 5
+
+
+def test_search_quality_finds_highest_fitting_quality():
+    img = make_photo(random.Random(5), (400, 300))
+    sizes = {quality: len(encode_image(img, 'JPEG', quality)) for quality in range(5, 96)}
+    for fraction in (0.9, 0.6, 0.3, 0.15, 0.08):
+        target = int(sizes[95] * fraction)
+        expected = max((q for q, size in sizes.items() if size <= target), default=None)
+        for workers in (1, 3):
+            quality, data, trials = search_quality(img, 'JPEG', target, 5, 95, workers=workers)
+            assert quality == expected
+            if workers == 1:
+                # 二分需要约 log2(91) ≈ 7 次，插值应不多于此
+                assert trials <= 8
+
+
+def test_auto_format_skips_scaling_once_a_format_fits(tmp_path):
+    # JPEG 不缩放即可满足时，WebP 质量降到最低仍超出也不再搜索缩放比例
+    source = str(tmp_path / 'noise.bmp')
+    Image.effect_noise((800, 600), 90).convert('RGB').save(source)
+    stats, tracer = {}, Tracer()
+    success, message = compress_image(source, str(tmp_path / 'out.bmp'), target_kb=80, stats=stats,
+                                      formats='auto', tracer=tracer)
+    assert success, message
+    assert stats['scale'] == 1.0
+    assert not [record for record in tracer.records if record['stage'] == 'resize']
@@ -0,0 +1,66 @@
+"""监视文件夹的状态记录和跳过逻辑"""
+import os
+
+from PIL import Image
+
+from 图片监视 import STATE_FILE, FolderWatcher, WatchState
+
+
+def noise_jpeg(path):
+    Image.effect_noise((600, 500), 90).convert('RGB').save(path, quality=95)
+    return str(path)
+
+
+def watch_once(inbox, **options):
+    results = []
+    watcher = FolderWatcher(str(inbox), workers=1, interval=0.05, on_result=results.append, **options)
+    watcher.run(once=True)
+    return results
+
+
+def touch(path):
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+
+
+def test_processed_files_are_skipped_on_restart(tmp_path):
+    source = noise_jpeg(tmp_path / 'a.jpg')
+    results = watch_once(tmp_path, target_kb=20)
+    assert [(result['input'], result['status']) for result in results] == [(source, 'done')]
+    assert os.path.exists(results[0]['output'])
+    # 重启后未变化的文件不再提交
+    assert watch_once(tmp_path, target_kb=20) == []
+
+
+def test_touched_file_skips_compression(tmp_path):
+    source = noise_jpeg(tmp_path / 'a.jpg')
+    watch_once(tmp_path, target_kb=20)
+    touch(source)
+    results = watch_once(tmp_path, target_kb=20)
+    assert [(result['status'], result['message']) for result in results] == [('done', "内容未变化，跳过")]
+
+
+def test_failed_file_is_retried_after_touch(tmp_path):
+    source = noise_jpeg(tmp_path / 'a.jpg')
+    results = watch_once(tmp_path, target_kb=1)
+    assert [result['status'] for result in results] == ['failed']
+    touch(source)
+    results = watch_once(tmp_path, target_kb=1)
+    # 上次失败，内容未变也要重新压缩，不能记为已完成
+    assert [result['status'] for result in results] == ['failed']
+    assert results[0]['message'] != "内容未变化，跳过"
+    state = WatchState(str(tmp_path / STATE_FILE))
+    try:
+        assert state.get(source)[3] == 'failed'
+    finally:
+        state.close()
+
+
+def test_changed_content_is_recompressed(tmp_path):
+    source = noise_jpeg(tmp_path / 'a.jpg')
+    watch_once(tmp_path, target_kb=20)
+    noise_jpeg(source)
+    touch(source)
+    results = watch_once(tmp_path, target_kb=20)
+    assert [result['status'] for result in results] == ['done']
+    assert results[0]['message'] != "内容未变化，跳过"
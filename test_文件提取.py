@@ -0,0 +1,172 @@
+"""文件提取中断后继续处理的回归测试"""
+import errno
+import os
+import shutil
+import threading
+
+import pytest
+
+import 文件提取
+from 文件提取 import Journal, copy_no_replace, extract_tree, move_no_replace, recover
+
+
+def make_tree(root):
+    folder = root / 'd0'
+    folder.mkdir()
+    for name in ('f0.txt', 'f1.txt', 'f2.txt'):
+        (folder / name).write_text(name)
+    return folder
+
+
+def cancel_after_first_move(root):
+    cancel = threading.Event()
+    journal = Journal(str(root))
+    for event in extract_tree(str(root), cancel=cancel, journal=journal):
+        if event[0] == 'move':
+            cancel.set()
+    journal.close()
+
+
+def resume(root):
+    resumed, kept = recover(str(root))
+    assert resumed
+    journal = Journal(str(root), fresh=False)
+    list(extract_tree(str(root), journal=journal, skip_dirs=kept))
+    journal.close(complete=True)
+
+
+def contents(root):
+    return sorted(path.read_text() for path in root.rglob('*.txt'))
+
+
+def unmoved_name(folder):
+    return sorted(path.name for path in folder.iterdir())[0]
+
+
+def test_resume_keeps_unrelated_file_with_same_size(tmp_path):
+    folder = make_tree(tmp_path)
+    cancel_after_first_move(tmp_path)
+    name = unmoved_name(folder)
+    # 取消后用户在根目录放入同名、同样大小的无关文件
+    (tmp_path / name).write_text('x' * len(name))
+    resume(tmp_path)
+    assert contents(tmp_path) == sorted(['f0.txt', 'f1.txt', 'f2.txt', 'x' * len(name)])
+    assert not folder.exists()
+
+
+def test_resume_keeps_unrelated_file_with_other_size(tmp_path):
+    folder = make_tree(tmp_path)
+    cancel_after_first_move(tmp_path)
+    name = unmoved_name(folder)
+    (tmp_path / name).write_text('user data')
+    resume(tmp_path)
+    assert contents(tmp_path) == sorted(['f0.txt', 'f1.txt', 'f2.txt', 'user data'])
+
+
+def test_resume_finishes_interrupted_link_move(tmp_path):
+    folder = make_tree(tmp_path)
+    cancel_after_first_move(tmp_path)
+    name = unmoved_name(folder)
+    # 建立硬链接后、删除源文件前中断
+    os.link(folder / name, tmp_path / name)
+    resume(tmp_path)
+    assert contents(tmp_path) == ['f0.txt', 'f1.txt', 'f2.txt']
+
+
+@pytest.mark.parametrize('renameat2', [None, False])
+def test_move_without_hardlinks_renames_instead_of_copying(tmp_path, monkeypatch, renameat2):
+    # vfat、exFAT 等文件系统上 os.link 失败，应在同一设备内重命名而不是复制数据
+    def no_link(*args, **kwargs):
+        raise OSError(errno.EPERM, 'Operation not permitted')
+
+    def no_copy(*args, **kwargs):
+        raise AssertionError('copied')
+
+    monkeypatch.setattr(os, 'link', no_link)
+    monkeypatch.setattr(shutil, 'copy2', no_copy)
+    # False 表示 renameat2 不可用，走占位文件 + os.rename
+    monkeypatch.setattr(文件提取, '_renameat2', renameat2)
+    src, dest, other = tmp_path / 'a.txt', tmp_path / 'b.txt', tmp_path / 'c.txt'
+    src.write_text('a')
+    other.write_text('c')
+    with pytest.raises(FileExistsError):
+        move_no_replace(str(src), str(other))
+    assert other.read_text() == 'c'
+    move_no_replace(str(src), str(dest))
+    assert not src.exists()
+    assert dest.read_text() == 'a'
+
+
+def test_copy_syncs_before_removing_source(tmp_path, monkeypatch):
+    # 跨设备复制时目标文件和目录都 fsync 之后才能删除源文件
+    events = []
+    fsync, unlink = os.fsync, os.unlink
+    monkeypatch.setattr(os, 'fsync', lambda fd: events.append('fsync') or fsync(fd))
+    monkeypatch.setattr(os, 'unlink',
+                        lambda path, **kwargs: events.append(('unlink', str(path))) or unlink(path, **kwargs))
+    src = tmp_path / 'a.txt'
+    src.write_text('a' * 1000)
+    copy_no_replace(str(src), str(tmp_path / 'b.txt'))
+    assert events[:2] == ['fsync', 'fsync']
+    assert events[-1] == ('unlink', str(src))
+    assert (tmp_path / 'b.txt').read_text() == 'a' * 1000
+
+
+def write_files(root, files):
+    for name, data in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+
+def test_find_duplicates_groups_identical_content(tmp_path):
+    block = 文件提取.HASH_BLOCK
+    write_files(tmp_path, {
+        'a.txt': b'same', 'd0/b.txt': b'same', 'd0/c.txt': b'diff',
+        # 首尾相同、只有中间不同的大文件要靠完整哈希区分
+        'd1/big0.bin': b'x' * block + b'0' + b'x' * block, 'd1/big1.bin': b'x' * block + b'1' + b'x' * block,
+        'd1/big2.bin': b'x' * block + b'0' + b'x' * block,
+        'd1/empty0': b'', 'd1/empty1': b'',
+    })
+    groups = 文件提取.find_duplicates(str(tmp_path), workers=2)
+    assert set(groups) == {str(tmp_path / name) for name in ('a.txt', 'd0/b.txt', 'd1/big0.bin', 'd1/big2.bin')}
+    assert groups[str(tmp_path / 'a.txt')] == groups[str(tmp_path / 'd0/b.txt')]
+    assert groups[str(tmp_path / 'd1/big0.bin')] == groups[str(tmp_path / 'd1/big2.bin')]
+    assert groups[str(tmp_path / 'a.txt')] != groups[str(tmp_path / 'd1/big0.bin')]
+
+
+def extract_with_dedupe(root, dedupe):
+    duplicates = 文件提取.find_duplicates(str(root))
+    journal = Journal(str(root))
+    events = list(extract_tree(str(root), journal=journal, duplicates=duplicates, dedupe=dedupe))
+    journal.close(complete=True)
+    return events
+
+
+def test_dedupe_skip_leaves_duplicate_in_place(tmp_path):
+    write_files(tmp_path, {'a.txt': b'same', 'd0/b.txt': b'same', 'd0/c.txt': b'other'})
+    events = extract_with_dedupe(tmp_path, 'skip')
+    assert ('duplicate', str(tmp_path / 'd0/b.txt'), None, str(tmp_path / 'a.txt')) in events
+    assert (tmp_path / 'd0/b.txt').read_bytes() == b'same'
+    assert (tmp_path / 'c.txt').read_bytes() == b'other'
+    assert sorted(path.name for path in (tmp_path / 'd0').iterdir()) == ['b.txt']
+
+
+def test_dedupe_hardlink_shares_first_moved_copy(tmp_path):
+    write_files(tmp_path, {'d0/x.txt': b'same', 'd1/y.txt': b'same'})
+    events = extract_with_dedupe(tmp_path, 'hardlink')
+    assert [event[0] for event in events].count('duplicate') == 1
+    assert not (tmp_path / 'd0').exists() and not (tmp_path / 'd1').exists()
+    assert os.path.samefile(tmp_path / 'x.txt', tmp_path / 'y.txt')
+    assert (tmp_path / 'y.txt').read_bytes() == b'same'
+
+
+@pytest.mark.parametrize('dedupe', ['skip', 'hardlink'])
+def test_undo_restores_deduplicated_tree(tmp_path, dedupe):
+    files = {'a.txt': b'same', 'd0/b.txt': b'same', 'd0/c.txt': b'other', 'd0/d1/e.txt': b'same'}
+    write_files(tmp_path, files)
+    extract_with_dedupe(tmp_path, dedupe)
+    list(文件提取.undo_journal(str(tmp_path)))
+    restored = {path.relative_to(tmp_path).as_posix(): path.read_bytes()
+                for path in tmp_path.rglob('*') if path.is_file()}
+    assert restored == files
@@ -0,0 +1,57 @@
+import queue
+import threading
+
+
+class JobChannel:
+    """
+    后台任务与 Tk 界面之间的事件通道
+    后台线程用 emit/progress 发送事件，界面按固定的时间间隔调用 drain 一次取出所有事件，
+    连续的 progress 事件只保留最新的一条，其他事件按发送顺序保留。
+    cancel() 设置取消标记，后台任务在两次耗时操作之间检查 cancelled 后尽快结束
+    """
+    def __init__(self, cancel_event=None):
+        """
+        :param cancel_event: 取消标记，默认为 threading.Event；
+                             需要让子进程也能看到时传入 multiprocessing.Event
+        """
+        self.events = queue.Queue()
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self.finished = False
+
+    def emit(self, kind, /, **data):
+        """发送一个事件(线程安全)，数据中可以有名为 kind 的字段"""
+        self.events.put((kind, data))
+
+    def progress(self, **data):
+        """发送进度事件，界面只显示最新的一条"""
+        self.emit('progress', **data)
+
+    def finish(self, **data):
+        """发送任务结束事件"""
+        self.emit('finished', **data)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def drain(self):
+        """
+        取出当前所有事件
+        :return: [(事件类型, 数据字典)]，相邻的 progress 事件合并为最新的一条
+        """
+        events = []
+        while True:
+            try:
+                kind, data = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress' and events and events[-1][0] == 'progress':
+                events[-1] = (kind, data)
+            else:
+                events.append((kind, data))
+            if kind == 'finished':
+                self.finished = True
+        return events
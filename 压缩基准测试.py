@@ -0,0 +1,261 @@
+"""
+图片压缩基准测试
+
+在本地生成一组固定的合成图片(照片、线稿、RGBA PNG、调色板 GIF、超大图)，
+按 target_kb / max_quality 网格逐个运行 compress_image，记录试编码次数、耗时、
+峰值内存和最终大小，结果写入 JSON 基准文件，与旧的基准文件对比即可看出性能回退。
+
+用法:
+    python 压缩基准测试.py -o baseline.json
+    python 压缩基准测试.py --quick --compare baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from 图片压缩 import compress_image
+
+# 目标大小(KB) 和最高质量的测试网格
+TARGET_KB_GRID = (50, 200, 800)
+MAX_QUALITY_GRID = (75, 95)
+QUICK_TARGET_KB_GRID = (200,)
+QUICK_MAX_QUALITY_GRID = (85,)
+
+
+def _noise(rng, size, mode='L'):
+    """生成可复现的随机噪声图"""
+    channels = len(mode)
+    return Image.frombytes(mode, size, rng.randbytes(size[0] * size[1] * channels))
+
+
+def make_photo(rng, size):
+    """模拟照片: 平滑的大块色彩 + 细节 + 轻微噪点"""
+    base = _noise(rng, (max(size[0] // 64, 2), max(size[1] // 64, 2)), 'RGB').resize(size, Image.BICUBIC)
+    detail = _noise(rng, (max(size[0] // 8, 2), max(size[1] // 8, 2)), 'RGB').resize(size, Image.BILINEAR)
+    img = Image.blend(base, detail, 0.25)
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        r = rng.randrange(size[0] // 40 + 1, size[0] // 6 + 2)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+    img = img.filter(ImageFilter.GaussianBlur(2))
+    return Image.blend(img, _noise(rng, size, 'RGB'), 0.06)
+
+
+def make_line_art(rng, size):
+    """模拟线稿/截图: 白底、少量颜色、锐利边缘"""
+    img = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(img)
+    colors = [(0, 0, 0), (200, 30, 30), (30, 90, 200), (40, 160, 60)]
+    for _ in range(300):
+        points = [(rng.randrange(size[0]), rng.randrange(size[1])) for _ in range(2)]
+        draw.line(points, fill=rng.choice(colors), width=rng.randrange(1, 5))
+    for _ in range(30):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.text((x, y), "基准 benchmark %d" % rng.randrange(1000), fill=rng.choice(colors))
+    return img
+
+
+def make_rgba(rng, size):
+    """带透明通道的 PNG: 照片内容 + 渐变透明度"""
+    img = make_photo(rng, size).convert('RGBA')
+    alpha = Image.linear_gradient('L').resize(size)
+    img.putalpha(alpha)
+    return img
+
+
+def make_palette(rng, size):
+    """调色板 GIF"""
+    return make_line_art(rng, size).quantize(colors=32)
+
+
+# 名称 -> (生成函数, 尺寸, 保存格式)
+CORPUS = {
+    'photo.jpg': (make_photo, (2000, 1500), 'JPEG'),
+    'photo_small.jpg': (make_photo, (640, 480), 'JPEG'),
+    'line_art.png': (make_line_art, (1600, 1200), 'PNG'),
+    'rgba.png': (make_rgba, (1200, 900), 'PNG'),
+    'palette.gif': (make_palette, (1024, 768), 'GIF'),
+    'large_photo.jpg': (make_photo, (8000, 6000), 'JPEG'),
+    'large_line_art.png': (make_line_art, (6000, 4500), 'PNG'),
+}
+QUICK_CORPUS = ('photo.jpg', 'line_art.png', 'rgba.png', 'palette.gif')
+
+
+def build_corpus(corpus_dir, names, seed=0):
+    """
+    生成合成图片集，已存在的文件不会重新生成
+    每张图片使用由名称和种子决定的随机数，保证在不同机器上内容一致
+    :return: [图片路径]
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    paths = []
+    for name in names:
+        make, size, fmt = CORPUS[name]
+        path = os.path.join(corpus_dir, name)
+        if not os.path.exists(path):
+            rng = random.Random(f"{seed}:{name}")
+            img = make(rng, size)
+            img.save(path, fmt, **({'quality': 95} if fmt == 'JPEG' else {}))
+        paths.append(path)
+    return paths
+
+
+def run_case(input_path, target_kb, max_quality):
+    """
+    运行一次压缩并返回测量结果
+    在独立的子进程中执行，峰值内存只反映这一次压缩
+    """
+    stats = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        output_path = os.path.join(out_dir, os.path.basename(input_path))
+        start = time.perf_counter()
+        success, message = compress_image(input_path, output_path, target_kb=target_kb,
+                                          max_quality=max_quality, stats=stats)
+        wall = time.perf_counter() - start
+    target_bytes = target_kb * 1024
+    return {
+        'image': os.path.basename(input_path),
+        'target_kb': target_kb,
+        'max_quality': max_quality,
+        'success': success,
+        'message': message,
+        'trials': stats.get('trials'),
+        'wall_s': round(wall, 4),
+        'peak_rss_mb': round(stats['peak_rss'] / 1024 / 1024, 1) if stats.get('peak_rss') else None,
+        'bytes': stats.get('size'),
+        'target_bytes': target_bytes,
+        'size_ratio': round(stats['size'] / target_bytes, 4) if stats.get('size') else None,
+        'quality': stats.get('quality'),
+        'scale': stats.get('scale'),
+    }
+
+
+def run_benchmark(paths, target_grid, quality_grid, repeat=1):
+    """
+    运行整个网格，重复多次时取耗时最短的一次
+    每个用例使用新的子进程(maxtasksperchild=1)，避免峰值内存互相影响
+    """
+    cases = [(path, target_kb, max_quality)
+             for path in paths for target_kb in target_grid for max_quality in quality_grid]
+    results = []
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        for case in cases:
+            runs = [pool.apply(run_case, case) for _ in range(repeat)]
+            best = min(runs, key=lambda run: run['wall_s'])
+            best['peak_rss_mb'] = max((run['peak_rss_mb'] or 0) for run in runs) or None
+            results.append(best)
+            print(f"{best['image']:<22} {best['target_kb']:>5}KB q<={best['max_quality']:<3} "
+                  f"试编码 {best['trials']:>3} 次  {best['wall_s']:>7.3f}s  "
+                  f"{best['peak_rss_mb'] or 0:>7.1f}MB  {best['size_ratio'] or 0:.3f}x 目标",
+                  flush=True)
+    return results
+
+
+def case_key(result):
+    return result['image'], result['target_kb'], result['max_quality']
+
+
+def compare(baseline, results, wall_tolerance=0.2):
+    """
+    与旧基准对比，打印每个用例的变化和总计
+    试编码次数不包括 PNG 的无损重新压缩等额外工作，所以同时检查总耗时
+    :param wall_tolerance: 总耗时允许超出基准的比例，用于吸收计时波动
+    :return: 试编码总次数没有增加且总耗时没有超出容差时为 True
+    """
+    old = {case_key(result): result for result in baseline['results']}
+    totals = {'trials': [0, 0], 'wall_s': [0.0, 0.0], 'bytes': [0, 0]}
+    print("\n与基准对比:")
+    for result in results:
+        before = old.get(case_key(result))
+        if before is None:
+            continue
+        changes = []
+        for field in totals:
+            a, b = before.get(field) or 0, result.get(field) or 0
+            totals[field][0] += a
+            totals[field][1] += b
+            if a != b:
+                changes.append(f"{field} {a} -> {b}")
+        if changes:
+            print(f"  {'/'.join(map(str, case_key(result)))}: " + ", ".join(changes))
+    for field, (a, b) in totals.items():
+        change = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+        print(f"  合计 {field}: {a:.6g} -> {b:.6g} ({change})")
+    ok = True
+    if totals['trials'][1] > totals['trials'][0]:
+        print("  试编码总次数增加")
+        ok = False
+    if totals['wall_s'][1] > totals['wall_s'][0] * (1 + wall_tolerance):
+        print(f"  总耗时超出基准 {wall_tolerance * 100:.0f}% 以上")
+        ok = False
+    return ok
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="图片压缩基准测试")
+    parser.add_argument('-o', '--output', help="结果写入的 JSON 文件")
+    parser.add_argument('--compare', help="对比的旧基准 JSON 文件")
+    parser.add_argument('--corpus', default=os.path.join(tempfile.gettempdir(), 'py-tool-bench-corpus'),
+                        help="合成图片存放目录(默认在系统临时目录)")
+    parser.add_argument('--quick', action='store_true', help="只跑小图和单组参数")
+    parser.add_argument('--wall-tolerance', type=float, default=0.2,
+                        help="对比时总耗时允许超出基准的比例(默认 0.2)")
+    parser.add_argument('--repeat', type=int, default=1, help="每个用例重复次数，耗时取最小值")
+    parser.add_argument('--seed', type=int, default=0, help="合成图片的随机种子")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = QUICK_CORPUS if args.quick else tuple(CORPUS)
+    target_grid = QUICK_TARGET_KB_GRID if args.quick else TARGET_KB_GRID
+    quality_grid = QUICK_MAX_QUALITY_GRID if args.quick else MAX_QUALITY_GRID
+
+    print(f"生成测试图片: {args.corpus}", flush=True)
+    paths = build_corpus(args.corpus, names, args.seed)
+    results = run_benchmark(paths, target_grid, quality_grid, max(args.repeat, 1))
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'pillow': Image.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+            'quick': args.quick,
+        },
+        'totals': {
+            'trials': sum(result['trials'] or 0 for result in results),
+            'wall_s': round(sum(result['wall_s'] for result in results), 3),
+            'bytes': sum(result['bytes'] or 0 for result in results),
+            'failures': sum(not result['success'] for result in results),
+        },
+        'results': results,
+    }
+    print(f"\n合计: 试编码 {report['totals']['trials']} 次, 耗时 {report['totals']['wall_s']:.2f}s, "
+          f"失败 {report['totals']['failures']} 个")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(baseline, results, args.wall_tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+各工具的统一入口，打包时只需打包这一个文件
+
+用法:
+    python 启动器.py              # 打开工具选择窗口
+    python 启动器.py 图片压缩      # 直接打开某个工具
+
+启动时只导入 tkinter，先显示窗口；选中工具后才导入该工具的界面模块，
+图片压缩用到的 PIL 等大模块在工具窗口显示之后再在后台导入。
+界面模块用函数内的 import 语句导入而不是按名称动态导入，PyInstaller 分析时才能找到它们。
+"""
+import sys
+import tkinter as tk
+
+def _image_compressor():
+    from 图片压缩界面 import ImageCompressorApp
+    return ImageCompressorApp
+
+
+def _file_extractor():
+    from 文件提取工具 import FileExtractorApp
+    return FileExtractorApp
+
+
+# 工具名 -> 导入并返回界面类的函数
+TOOLS = {
+    '图片压缩': _image_compressor,
+    '文件提取': _file_extractor,
+}
+
+
+def open_tool(root, name):
+    """在 root 窗口中打开工具，替换原有内容"""
+    for child in root.winfo_children():
+        child.destroy()
+    app_class = TOOLS[name]()
+    return app_class(root)
+
+
+class Launcher:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("工具箱")
+        self.root.geometry("300x200")
+        
+        tk.Label(self.root, text="选择要使用的工具", font=("Arial", 14, "bold")).pack(pady=15)
+        for name in TOOLS:
+            tk.Button(self.root, text=name, width=20, command=lambda name=name: open_tool(self.root, name)).pack(pady=5)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] not in TOOLS:
+        print(f"错误: 未知的工具 {argv[0]}，可选: {'、'.join(TOOLS)}", file=sys.stderr)
+        return 2
+    root = tk.Tk()
+    if argv:
+        open_tool(root, argv[0])
+    else:
+        Launcher(root)
+    root.mainloop()
+    return 0
+
+
+if __name__ == '__main__':
+    # 打包成exe后多进程批量压缩需要，未打包时跳过以节省启动时间
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+启动时间基准测试
+
+在新的子进程中分别启动各个工具，记录:
+    start_s   从启动子进程到开始导入工具模块(解释器启动)
+    import_s  导入界面模块
+    paint_s   创建窗口并完成第一次绘制
+    total_s   从启动子进程到第一次绘制完成
+    pil       第一次绘制完成时是否已经导入了 PIL
+每个工具重复多次，各项取中位数。需要图形环境。
+
+用法:
+    python 启动基准测试.py
+    python 启动基准测试.py --repeat 10 -o startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 用例名 -> (要导入的模块, 界面模块, 界面类)；图片压缩.py 不带参数时先导入自身再打开界面
+CASES = {
+    '图片压缩.py': (('图片压缩', '图片压缩界面'), '图片压缩界面', 'ImageCompressorApp'),
+    '文件提取工具.py': (('文件提取工具',), '文件提取工具', 'FileExtractorApp'),
+    '启动器.py': (('启动器',), '启动器', 'Launcher'),
+}
+
+# 在子进程中运行，结果以一行 JSON 输出
+_CHILD = r"""
+import importlib, json, sys, time
+import_start = time.time()
+modules = [importlib.import_module(name) for name in sys.argv[1].split(',')]
+import_end = time.time()
+import tkinter as tk
+root = tk.Tk()
+getattr(importlib.import_module(sys.argv[2]), sys.argv[3])(root)
+root.update()
+paint_end = time.time()
+print(json.dumps(dict(import_start=import_start, import_end=import_end, paint_end=paint_end,
+                      pil='PIL' in sys.modules)))
+root.destroy()
+"""
+
+
+def run_case(modules, app_module, app_class):
+    """在新的子进程中启动一次，返回各阶段耗时(秒)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = time.time()
+    output = subprocess.run(
+        [sys.executable, '-c', _CHILD, ','.join(modules), app_module, app_class],
+        cwd=here, capture_output=True, text=True, encoding='utf-8', check=True
+    ).stdout
+    times = json.loads(output.strip().splitlines()[-1])
+    return dict(start_s=times['import_start'] - start, import_s=times['import_end'] - times['import_start'],
+                paint_s=times['paint_end'] - times['import_end'], total_s=times['paint_end'] - start,
+                pil=times['pil'])
+
+
+def run_benchmark(names, repeat):
+    results = {}
+    for name in names:
+        runs = [run_case(*CASES[name]) for _ in range(repeat)]
+        result = {key: round(statistics.median(run[key] for run in runs), 4)
+                  for key in ('start_s', 'import_s', 'paint_s', 'total_s')}
+        result['pil'] = any(run['pil'] for run in runs)
+        results[name] = result
+        print(f"{name:<16} 解释器 {result['start_s'] * 1000:7.1f}ms  导入 {result['import_s'] * 1000:7.1f}ms  "
+              f"首次绘制 {result['paint_s'] * 1000:7.1f}ms  合计 {result['total_s'] * 1000:7.1f}ms  "
+              f"PIL {'已导入' if result['pil'] else '未导入'}", flush=True)
+    return results
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="启动时间基准测试")
+    parser.add_argument('cases', nargs='*', help=f"要测试的工具({'、'.join(CASES)})，默认全部")
+    parser.add_argument('--repeat', type=int, default=5, help="每个工具启动次数，各项取中位数，默认5")
+    parser.add_argument('-o', '--output', help="结果写入的 JSON 文件")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        print(f"错误: 未知的工具 {'、'.join(unknown)}", file=sys.stderr)
+        return 2
+    try:
+        results = run_benchmark(args.cases or list(CASES), max(args.repeat, 1))
+    except subprocess.CalledProcessError as e:
+        print(f"启动失败(需要图形环境):\n{e.stderr}", file=sys.stderr)
+        return 1
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,981 @@
-from PIL import Image, ImageTk
+import time
+
+# 记录导入开始时间，用于统计命令行模式的启动耗时
+_IMPORT_START = time.perf_counter()
+
+from PIL import Image
 import os
 import io
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-import threading
+import argparse
+import contextlib
+import glob
+import hashlib
+import json
+import math
+import shutil
 import sys
+import tempfile
+import threading
+
+# 批量模式下处理的图片扩展名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp')
+
+# 输出格式对应的扩展名
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif', 'BMP': '.bmp'}
+# 靠质量参数压缩的有损格式
+LOSSY_FORMATS = ('JPEG', 'WEBP')
+# 靠减少调色板颜色数压缩的格式，质量100表示无损保存
+PALETTE_FORMATS = ('PNG', 'GIF')
+# 各输出格式可以直接保存的图片模式，其他模式先转换
+FORMAT_MODES = {
+    'JPEG': ('RGB', 'L', 'CMYK'),
+    'WEBP': ('RGB', 'RGBA'),
+    'PNG': ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'I', 'I;16'),
+    'GIF': ('1', 'L', 'P', 'RGB', 'RGBA'),
+    'BMP': ('1', 'L', 'P', 'RGB', 'RGBA'),
+}
+# 命令行 --format 的可选值
+FORMAT_CHOICES = ('keep', 'auto', 'jpeg', 'png', 'webp', 'gif')
+
+class Tracer:
+    """
+    记录压缩流程中每个阶段的耗时和参数(解码、模式转换、每次试编码、缩放、写出等)
+    每条记录是一个字典: stage、start(相对创建时间的秒数)、elapsed(秒)、thread 以及阶段相关的字段，
+    保存在 records 中；给出 path 时同时按 JSON lines 追加写入文件，便于在线上收集后分析
+    """
+    def __init__(self, path=None, **context):
+        """
+        :param path: 可选的 JSON lines 文件路径，追加写入，多个进程可以共用同一个文件
+        :param context: 附加到每条记录上的字段，如输入文件名
+        """
+        self.records = []
+        self.context = context
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+
+    @contextlib.contextmanager
+    def span(self, stage, **fields):
+        """
+        记录一个阶段的耗时，with 块内可以往产出的字典里补充字段(如编码后的大小)
+        块内抛出异常时记录异常类型后继续抛出
+        """
+        start = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            fields['error'] = type(e).__name__
+            raise
+        finally:
+            self.record(stage, start, time.perf_counter() - start, **fields)
+
+    def record(self, stage, start, elapsed, **fields):
+        record = dict(self.context, stage=stage, start=round(start - self.origin, 6),
+                      elapsed=round(elapsed, 6), thread=threading.current_thread().name, **fields)
+        with self._lock:
+            self.records.append(record)
+            if self._file is not None:
+                # 一条记录一次写入，多进程追加时各行不会交错
+                self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                self._file.flush()
+
+    def summary(self):
+        """按阶段汇总: {阶段: {'count': 次数, 'elapsed': 总耗时}}"""
+        totals = {}
+        with self._lock:
+            for record in self.records:
+                total = totals.setdefault(record['stage'], {'count': 0, 'elapsed': 0.0})
+                total['count'] += 1
+                total['elapsed'] = round(total['elapsed'] + record['elapsed'], 6)
+        return totals
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@contextlib.contextmanager
+def trace_span(tracer, stage, **fields):
+    """tracer 为None时只产出字段字典，不做记录，调用处无需判断"""
+    if tracer is None:
+        yield fields
+    else:
+        with tracer.span(stage, **fields) as span:
+            yield span
+
+
+def has_alpha(img):
+    """图片是否带透明通道"""
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def resample_image(img):
+    """
+    返回可以用 reduce 和 LANCZOS 缩放的图片
+    调色板和1位图片按索引缩放会出错或只能取最近邻，I;16 不支持 reduce，先分别转换为 RGB/RGBA、L 和 I
+    """
+    if img.mode in ('P', 'PA'):
+        return img.convert('RGBA' if has_alpha(img) else 'RGB')
+    if img.mode == '1':
+        return img.convert('L')
+    if img.mode.startswith('I;16'):
+        return img.convert('I')
+    return img
+
+
+def palette_colors(quality):
+    """
+    调色板格式下质量对应的颜色数，质量100表示不减少颜色
+    颜色数按2的幂分档，每12个质量一档，12对应2色、96对应256色
+    """
+    return 2 ** max(1, min(8, round(quality / 12)))
+
+
+def palette_levels(min_quality, max_quality):
+    """调色板格式在[min_quality, max_quality]内实际不同的质量档位，从高到低"""
+    levels = ([100] if max_quality >= 100 else []) + [12 * k for k in range(8, 0, -1)]
+    return [quality for quality in levels if min_quality <= quality <= max_quality]
+
+
+def describe_quality(fmt, quality):
+    """用于提示信息的质量说明"""
+    if fmt in LOSSY_FORMATS:
+        return f"{quality}%"
+    if fmt in PALETTE_FORMATS and quality < 100:
+        return f"{palette_colors(quality)} 色"
+    return "无损"
+
+
+def quality_range(fmt, min_quality, max_quality):
+    """
+    各格式实际搜索的质量范围
+    有损格式使用给定的范围；调色板格式从无损(100)开始向下减少颜色；
+    BMP 等没有压缩参数的格式只能编码一次，之后直接缩小尺寸
+    """
+    if fmt in LOSSY_FORMATS:
+        return min_quality, max_quality
+    if fmt in PALETTE_FORMATS:
+        return min(min_quality, 100), 100
+    return 100, 100
+
+
+def format_for_path(path):
+    """由文件扩展名得到输出格式，无法识别时返回None"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.jpeg':
+        return 'JPEG'
+    for fmt, fmt_ext in FORMAT_EXTENSIONS.items():
+        if ext == fmt_ext:
+            return fmt
+    return None
+
+
+def choose_formats(formats, output_path, source_format, img):
+    """
+    确定要尝试的输出格式
+    :param formats: None 表示按输出文件扩展名(无法识别时沿用源格式)；
+                    'auto' 表示按图片内容挑选候选格式，最后取缩放最少、文件最小的一种；也可以直接给出格式列表
+    :return: 格式列表
+    """
+    if formats == 'auto':
+        from PIL import features
+        # 有透明通道时不考虑 JPEG；线稿、截图等非照片来源用调色板 PNG 往往更小
+        candidates = ['PNG', 'WEBP'] if has_alpha(img) else ['JPEG', 'WEBP']
+        if source_format in ('PNG', 'GIF', 'BMP') and 'PNG' not in candidates:
+            candidates.append('PNG')
+        if not features.check('webp'):
+            candidates.remove('WEBP')
+        return candidates
+    if formats:
+        return ['JPEG' if fmt.upper() == 'JPG' else fmt.upper() for fmt in formats]
+    # 多帧 JPEG(MPO) 按普通 JPEG 处理
+    return [format_for_path(output_path) or ('JPEG' if source_format == 'MPO' else source_format)]
+
+
+def prepare_image(img, fmt, tracer=None):
+    """
+    把图片转换为输出格式可以保存的模式
+    JPEG 不支持透明通道，转为RGB；其他格式尽量保留透明通道
+    """
+    modes = FORMAT_MODES.get(fmt)
+    if modes is None or img.mode in modes:
+        return img
+    mode = 'RGBA' if has_alpha(img) and 'RGBA' in modes else 'RGB'
+    with trace_span(tracer, 'convert', source_mode=img.mode, mode=mode):
+        return img.convert(mode)
+
+
+def quantize_image(img, colors):
+    """减少到最多 colors 种颜色的调色板图片，带透明通道时保留透明度"""
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if has_alpha(img) else 'RGB')
+    # FASTOCTREE 比 MEDIANCUT 快一个数量级，并且支持透明通道
+    return img.quantize(colors, method=Image.Quantize.FASTOCTREE)
+
+
+def encode_image(img, fmt, quality, tracer=None, **fields):
+    """
+    按指定格式和质量编码到内存，返回编码后的字节
+    有损格式把 quality 传给编码器；调色板格式按 palette_colors(quality) 减少颜色，质量100时无损保存；
+    其他格式忽略 quality
+    :param tracer: 可选的 Tracer，记录本次编码的耗时和大小，fields 为额外记录的字段
+    """
+    with trace_span(tracer, 'encode', format=fmt, quality=quality, width=img.width, height=img.height,
+                    **fields) as span:
+        buffer = io.BytesIO()
+        if fmt in LOSSY_FORMATS:
+            img.save(buffer, format=fmt, quality=quality)
+        elif fmt in PALETTE_FORMATS and quality < 100:
+            quantize_image(img, palette_colors(quality)).save(buffer, format=fmt)
+        else:
+            img.save(buffer, format=fmt)
+        span['bytes'] = buffer.tell()
+    return buffer.getvalue()
+
+
+def optimize_png(data, tracer=None):
+    """
+    用最高的 zlib 压缩级别和 optimize 重新编码 PNG，像素不变，变小时才采用
+    试编码阶段使用默认的压缩级别，只对最终结果做一次这种较慢的编码
+    """
+    with trace_span(tracer, 'optimize', format='PNG', bytes=len(data)) as span:
+        buffer = io.BytesIO()
+        Image.open(io.BytesIO(data)).save(buffer, format='PNG', optimize=True)
+        span['optimized_bytes'] = buffer.tell()
+    return min(data, buffer.getvalue(), key=len)
+
+
+class CompressionCancelled(Exception):
+    """压缩被取消"""
+
+
+def check_cancel(cancel):
+    """取消标记(threading.Event 或 multiprocessing.Event)已设置时抛出 CompressionCancelled"""
+    if cancel is not None and cancel.is_set():
+        raise CompressionCancelled()
+
+
+# 只有一个实测点时假定的 d log(大小) / d 质量，JPEG/WebP 在常用质量区间内每档约 3%
+LOG_SIZE_PER_QUALITY = 0.03
+
+
+def _spread(lo, hi, count):
+    """在开区间(lo, hi)内均匀取最多count个整数质量"""
+    return sorted({lo + (hi - lo) * i // (count + 1) for i in range(1, count + 1)} - {lo, hi})
+
+
+def search_quality(img, fmt, target_bytes, min_quality, max_quality, progress_callback=None,
+                   sizes=None, lower=None, progress_range=(0, 50), workers=1, guess=None,
+                   predictor=None, scale=1.0, cancel=None, tracer=None):
+    """
+    在[min_quality, max_quality]范围内查找能满足目标大小的最高质量
+    先试最高质量，之后用割线在 log(大小) 上插值逼近目标大小(有损格式的大小大致随质量指数增长)；
+    只有一个实测点时按典型斜率 LOG_SIZE_PER_QUALITY 外推，插值落到最低质量以下时才试最低质量，
+    插值未能把区间缩小一半、且插值点的大小与目标相差 10% 以上时改用二分，保证约 log2(范围) 次编码内收敛；
+    给出预测质量 guess 时从它开始，向上或向下按倍增的步长找到区间，预测准确时只需两次编码
+    workers 大于1时每轮在线程池中同时编码多个均匀分布的候选质量(多路搜索)，
+    已确定无用的候选(低于已满足的质量或高于已超出的质量)会被取消；每个线程编码自己的一份像素副本
+    :param img: 已解码的图片
+    :param fmt: 编码格式
+    :param target_bytes: 目标大小(字节)
+    :param min_quality: 最低质量
+    :param max_quality: 最高质量
+    :param progress_callback: 进度回调函数
+    :param sizes: 可选的字典，记录每个试过的质量对应的大小(字节)
+    :param lower: 可选的(质量, 编码数据)，已知满足要求的下界，可省去最低质量的试编码
+    :param progress_range: 本阶段在总进度中占的区间
+    :param workers: 同时试编码的线程数
+    :param guess: 可选的预测质量
+    :param predictor: 可选的 SizePredictor，每次试编码的实际大小会反馈给它以统计预测误差
+    :param scale: img 相对原图的缩放比例，反馈给 predictor 时使用
+    :param cancel: 可选的取消标记，每次编码前检查，已设置时抛出 CompressionCancelled
+    :param tracer: 可选的 Tracer，记录每次试编码
+    :return: (质量, 编码数据, 试编码次数)，无法满足时质量和数据为None
+    """
+    if fmt in PALETTE_FORMATS:
+        return search_palette(img, fmt, target_bytes, min_quality, max_quality, progress_callback, sizes, lower,
+                              progress_range, cancel, tracer, scale)
+    trials = 0
+    # 预计的最多编码次数，仅用于进度显示
+    expected = max(1, (max_quality - min_quality).bit_length() + 2)
+    start, end = progress_range
+
+    # lo 为已知满足要求的最高质量，hi 为已知超出的最低质量
+    lo, lo_size, best_data = None, None, None
+    hi, hi_size = max_quality + 1, None
+    # 所有实测的 {质量: 大小}，lo 未知时用 hi 之上的实测点估计斜率
+    measured = {}
+    if lower is not None:
+        lo, best_data = lower
+        lo_size = len(best_data)
+        if lo >= max_quality:
+            return lo, best_data, trials
+
+    def record(quality, data):
+        nonlocal trials, lo, lo_size, best_data, hi, hi_size
+        trials += 1
+        measured[quality] = len(data)
+        if sizes is not None:
+            sizes[quality] = len(data)
+        if predictor is not None:
+            predictor.observe(quality, scale, len(data))
+        size_kb = len(data) / 1024
+        if progress_callback:
+            progress = start + min(end - start, int(trials / expected * (end - start)))
+            progress_callback(progress, f"尝试质量: {describe_quality(fmt, quality)}, 当前大小: {size_kb:.1f}KB")
+        if len(data) <= target_bytes:
+            if lo is None or quality > lo:
+                lo, lo_size, best_data = quality, len(data), data
+                if hi <= lo:
+                    # 大小随质量不严格单调时，以实测满足要求的质量为准
+                    hi, hi_size = lo + 1, None
+        elif quality < hi and (lo is None or quality > lo):
+            hi, hi_size = quality, len(data)
 
-def compress_image(input_path, output_path, target_kb=500, max_quality=85, min_quality=5, progress_callback=None):
+    def encode_shared(quality):
+        # Image.save 会把编码参数写到图片对象上，多个线程编码同一个对象会互相覆盖，
+        # 所以每个线程第一次编码时复制一份自己用，之后在这个线程里一直复用
+        own = getattr(local, 'img', None)
+        if own is None:
+            own = local.img = img.copy()
+        return encode_image(own, fmt, quality, tracer, scale=scale)
+
+    def run_round(qualities):
+        if executor is None:
+            for quality in qualities:
+                check_cancel(cancel)
+                record(quality, encode_image(img, fmt, quality, tracer, scale=scale))
+            return
+        check_cancel(cancel)
+        pending = {executor.submit(encode_shared, quality): quality for quality in qualities}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record(pending.pop(future), future.result())
+            check_cancel(cancel)
+            # 取消已经无意义的候选
+            for future, quality in list(pending.items()):
+                if quality >= hi or (lo is not None and quality <= lo):
+                    future.cancel()
+                    del pending[future]
+
+    executor = None
+    if workers > 1:
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+        img.load()
+        local = threading.local()
+        executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        if guess is not None and (lo is None or guess > lo):
+            # 从预测质量开始，并行时同时试它附近的质量
+            floor = min_quality if lo is None else lo + 1
+            guess = max(floor, min(max_quality, guess))
+            run_round(sorted({max(floor, min(max_quality, guess + offset))
+                              for offset in range(-(workers // 2), workers - workers // 2)}))
+            step = 1
+            while lo is None or hi > max_quality:
+                if lo is None:
+                    # 预测偏高，向下找到满足要求的质量
+                    if hi <= min_quality:
+                        return None, None, trials
+                    run_round([max(min_quality, hi - step)])
+                else:
+                    # 预测偏低，向上找到超出的质量
+                    if lo >= max_quality:
+                        return lo, best_data, trials
+                    run_round([min(max_quality, lo + step)])
+                step *= 2
+        elif workers > 1 and lo is None and max_quality > min_quality:
+            # 先试最高质量，并行时同时试最低质量和中间的质量
+            run_round([max_quality, min_quality] + _spread(min_quality, max_quality, workers - 2))
+        else:
+            run_round([max_quality])
+        if lo == max_quality:
+            return lo, best_data, trials
+        if max_quality <= min_quality:
+            return None, None, trials
+
+        use_bisect = False
+        while lo is None or hi - lo > 1:
+            if lo is None and hi <= min_quality:
+                # 最低质量仍超出则无法仅靠质量压缩
+                return None, None, trials
+            # lo 未知时区间下界取 min_quality 之下一档，插值和二分都不会越过 min_quality
+            floor = min_quality - 1 if lo is None else lo
+            width = hi - floor
+            slope = None
+            if hi_size is not None:
+                if lo is not None:
+                    if hi_size > lo_size:
+                        slope = math.log(hi_size / lo_size) / (hi - lo)
+                else:
+                    upper = min((q for q in measured if q > hi), default=None)
+                    slope = LOG_SIZE_PER_QUALITY
+                    if upper is not None and measured[upper] > hi_size:
+                        slope = math.log(measured[upper] / hi_size) / (upper - hi)
+            if use_bisect or slope is None:
+                quality = (floor + hi) // 2
+            else:
+                # 在 log(大小)-质量 曲线上从 hi 插值(lo 未知时外推)到目标大小
+                quality = hi - math.ceil(math.log(hi_size / target_bytes) / slope)
+            quality = max(floor + 1, min(hi - 1, quality))
+            if executor is not None:
+                # 插值点之外再加上均匀分布的候选一起编码
+                run_round(sorted(set(_spread(floor, hi, workers - 1)) | {quality}))
+            else:
+                run_round([quality])
+            # 插值没能把区间缩小一半、且插值点的大小离目标还远时，下一步改用二分
+            size = measured.get(quality)
+            use_bisect = ((hi - (min_quality - 1 if lo is None else lo)) * 2 > width
+                          and (size is None or abs(math.log(size / target_bytes)) > 0.1))
+    finally:
+        if executor is not None:
+            # 不等待已放弃的候选编码完成
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return lo, best_data, trials
+
+
+def search_palette(img, fmt, target_bytes, min_quality, max_quality, progress_callback=None, sizes=None,
+                   lower=None, progress_range=(0, 50), cancel=None, tracer=None, scale=1.0):
+    """
+    调色板格式(PNG、GIF)的搜索策略
+    颜色数只有 palette_levels 给出的几档，大小随颜色数单调增加，直接在这几档上二分：
+    先试最高档(通常是无损)，再试最低档，最低档仍超出时立即放弃，交给缩放处理，
+    最多约 log2(档数)+2 次编码
+    参数和返回值与 search_quality 相同
+    """
+    levels = palette_levels(min_quality, max_quality)
+    best_quality, best_data = lower if lower is not None else (None, None)
+    if best_quality is not None:
+        levels = [quality for quality in levels if quality > best_quality]
+    trials = 0
+    start, end = progress_range
+    expected = max(1, len(levels).bit_length())
+
+    def fits(quality):
+        nonlocal trials
+        check_cancel(cancel)
+        data = encode_image(img, fmt, quality, tracer, scale=scale)
+        trials += 1
+        if sizes is not None:
+            sizes[quality] = len(data)
+        if progress_callback:
+            progress = start + min(end - start, int(trials / expected * (end - start)))
+            progress_callback(progress, f"尝试质量: {describe_quality(fmt, quality)}, 当前大小: {len(data) / 1024:.1f}KB")
+        return data if len(data) <= target_bytes else None
+
+    if not levels:
+        return best_quality, best_data, trials
+    data = fits(levels[0])
+    if data is not None:
+        return levels[0], data, trials
+
+    # bad 为已知超出的档位下标，good 为已知满足的档位下标(len(levels) 表示 lower)
+    bad, good = 0, len(levels)
+    if best_quality is None and len(levels) > 1:
+        data = fits(levels[-1])
+        if data is None:
+            return None, None, trials
+        good, best_quality, best_data = len(levels) - 1, levels[-1], data
+    while good - bad > 1:
+        mid = (bad + good) // 2
+        data = fits(levels[mid])
+        if data is not None:
+            good, best_quality, best_data = mid, levels[mid], data
+        else:
+            bad = mid
+    return best_quality, best_data, trials
+
+
+def peak_rss():
+    """返回当前进程的峰值内存占用(字节)，无法获取时返回None"""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+
+            class ProcessMemoryCounters(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                    (name, ctypes.c_size_t) for name in (
+                        'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                        'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage'
+                    )
+                ]
+
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return None
+            return counters.PeakWorkingSetSize
+
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 上单位是字节，Linux 上是KB
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except Exception:
+        return None
+
+
+def open_image(input_path, scale=1.0, max_memory_mb=None, tracer=None):
+    """
+    打开并解码图片，需要时在解码阶段就缩小，避免先解码出原尺寸再缩放
+    JPEG 用 draft 模式直接按 1/2、1/4、1/8 解码，其他格式解码后用 reduce 缩小
+    :param input_path: 输入图片路径
+    :param scale: 需要的缩放比例，实际结果不小于它
+    :param max_memory_mb: 解码后图片占用内存的上限(MB)，超过时自动缩小，此时结果不大于上限对应的比例
+    :param tracer: 可选的 Tracer，记录解码耗时
+    :return: (图片, 源格式, 实际缩放比例)，图片保持原模式，转换由 prepare_image 按输出格式完成
+    """
+    img = Image.open(input_path)
+    original_format = img.format
+    width, height = img.size
+
+    memory_bound = False
+    if max_memory_mb:
+        # Pillow 内部每像素约占4字节，压缩过程中最多同时存在约两份图片
+        limit = math.sqrt(max_memory_mb * 1024 * 1024 / (width * height * 4 * 2))
+        if limit < scale:
+            scale, memory_bound = limit, True
+
+    with trace_span(tracer, 'decode', format=original_format, mode=img.mode, width=width, height=height,
+                    requested_scale=scale) as span:
+        if scale < 1 and original_format == 'JPEG':
+            img.draft(None, (math.ceil(width * scale), math.ceil(height * scale)))
+        img.load()
+        if scale < 1:
+            # draft 之后仍然偏大，或者不支持 draft 的格式，再按整数倍缩小
+            factor = img.width / (width * scale)
+            factor = math.ceil(factor - 0.05) if memory_bound else int(factor)
+            if factor >= 2:
+                img = resample_image(img).reduce(factor)
+        span.update(decoded_width=img.width, decoded_height=img.height)
+
+    return img, original_format, img.width / width
+
+
+def estimate_size(sizes, quality):
+    """根据已测得的 {质量: 大小} 估计某个质量下的大小，在对数空间中插值"""
+    if quality in sizes or len(sizes) == 1:
+        return sizes.get(quality) or next(iter(sizes.values()))
+    # 取两侧最近的已知点，超出范围时取最近的两个点外推
+    points = sorted(sizes.items())
+    index = sum(1 for q, _ in points if q < quality)
+    index = max(1, min(len(points) - 1, index))
+    (q1, b1), (q2, b2) = points[index - 1], points[index]
+    return b1 * (b2 / b1) ** ((quality - q1) / (q2 - q1))
+
+
+class SizePredictor:
+    """
+    用小探针图预测整图的编码大小，避免在明显超出的质量上浪费整图编码
+    探针有两种：从原图均匀取若干块原分辨率的小块拼成的图，代表原尺寸的细节密度；
+    以及不同大小的整图缩略图，代表缩小后的细节密度。在几个固定质量下编码探针得到每像素字节数，
+    其他质量在对数空间插值，其他缩放比例在相邻两级探针之间按 log(缩放) 插值，再乘以像素数。
+    每次整图编码的实际大小通过 observe 反馈，记录预测误差，并用缩放比例相近的实测结果校正后续预测
+    """
+    # 小于这个像素数的图片整图编码本身就很快，不值得预测
+    MIN_PIXELS = 1000000
+    PROBE_QUALITIES = (5, 15, 30, 50, 70, 85, 95)
+    TILE = 64
+    GRID = 4
+    THUMB_SIZES = (1024, 256)
+
+    def __init__(self, img, fmt, min_quality=5, max_quality=95, base_scale=1.0):
+        """
+        :param img: 已解码的图片
+        :param fmt: 编码格式
+        :param min_quality: 最低质量
+        :param max_quality: 最高质量
+        :param base_scale: img 相对原图的缩放比例，所有缩放比例都相对原图
+        """
+        self.fmt = fmt
+        self.base_scale = base_scale
+        self.pixels = img.width * img.height / base_scale ** 2
+        self.history = []
+        self.probe_encodes = 0
+        self._qualities = sorted({q for q in self.PROBE_QUALITIES if min_quality <= q <= max_quality}
+                                 | {min_quality, max_quality})
+
+        # 原分辨率小块拼成的探针，块边界按16像素对齐以贴合JPEG的编码块
+        tile = self.TILE
+        crop = Image.new(img.mode, (tile * self.GRID, tile * self.GRID))
+        for row in range(self.GRID):
+            for col in range(self.GRID):
+                left = (img.width - tile) * (2 * col + 1) // (2 * self.GRID) // 16 * 16
+                top = (img.height - tile) * (2 * row + 1) // (2 * self.GRID) // 16 * 16
+                crop.paste(img.crop((left, top, left + tile, top + tile)), (col * tile, row * tile))
+        # [(相对原图的缩放比例, {质量: (每像素字节数, 固定开销)})]，按缩放比例从大到小
+        self.levels = [(base_scale, self._measure(crop))]
+
+        source = resample_image(img)
+        for size in self.THUMB_SIZES:
+            ratio = size / max(img.size)
+            if ratio >= 0.5:
+                continue
+            thumb = source.resize((max(1, int(img.width * ratio)), max(1, int(img.height * ratio))),
+                                  Image.LANCZOS, reducing_gap=2.0)
+            self.levels.append((base_scale * ratio, self._measure(thumb)))
+
+    def _measure(self, probe):
+        # 扣除文件头等固定开销后的每像素字节数
+        tiny = probe.resize((8, 8))
+        table = {}
+        for quality in self._qualities:
+            overhead = len(encode_image(tiny, self.fmt, quality))
+            size = len(encode_image(probe, self.fmt, quality))
+            self.probe_encodes += 2
+            table[quality] = (max(1, size - overhead) / (probe.width * probe.height), overhead)
+        return table
+
+    @staticmethod
+    def _lookup(table, quality):
+        per_pixel = estimate_size({q: value[0] for q, value in table.items()}, quality)
+        overhead = estimate_size({q: value[1] for q, value in table.items()}, quality)
+        return per_pixel, overhead
+
+    def _predict_raw(self, quality, scale):
+        # 找到 scale 两侧相邻的两级探针，超出范围时用最近的两级外推
+        levels = self.levels
+        index = 1
+        while index < len(levels) - 1 and levels[index][0] > scale:
+            index += 1
+        bpp, overhead = self._lookup(levels[0][1], quality)
+        if len(levels) > 1:
+            (scale1, table1), (scale2, table2) = levels[index - 1], levels[index]
+            bpp1, overhead = self._lookup(table1, quality)
+            bpp2, _ = self._lookup(table2, quality)
+            t = math.log(scale1 / scale) / math.log(scale1 / scale2)
+            bpp = bpp1 * (bpp2 / bpp1) ** t
+        return bpp * self.pixels * scale ** 2 + overhead
+
+    def _correction(self, scale):
+        # 用缩放比例相近(1.5倍以内)的实测结果校正，取实测与预测之比的几何平均
+        ratios = [math.log(item['actual'] / item['raw']) for item in self.history
+                  if abs(math.log(item['scale'] / scale)) <= math.log(1.5)]
+        return math.exp(sum(ratios) / len(ratios)) if ratios else 1.0
+
+    def predict(self, quality, scale=1.0):
+        """预测在给定质量和缩放比例(相对原图)下的编码大小(字节)"""
+        return self._predict_raw(quality, scale) * self._correction(scale)
+
+    def quality_for(self, target_bytes, min_quality, max_quality, scale=1.0):
+        """预测能满足目标大小的最高质量，都超出时返回 min_quality"""
+        for quality in range(max_quality, min_quality - 1, -1):
+            if self.predict(quality, scale) <= target_bytes:
+                return quality
+        return min_quality
+
+    def scale_for(self, target_bytes, quality, min_scale=0.01):
+        """预测在给定质量下能满足目标大小的最大缩放比例(相对原图)"""
+        lo, hi = min_scale, self.base_scale
+        if self.predict(quality, hi) <= target_bytes:
+            return hi
+        for _ in range(30):
+            mid = (lo + hi) / 2
+            if self.predict(quality, mid) <= target_bytes:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def observe(self, quality, scale, actual):
+        """记录一次整图编码的实际大小和当时的预测值(error 为相对误差)，用于校正后续预测"""
+        predicted = self.predict(quality, scale)
+        self.history.append(dict(quality=quality, scale=scale, predicted=int(predicted), actual=actual,
+                                 error=(predicted - actual) / actual, raw=self._predict_raw(quality, scale)))
+
+
+def resize_image(img, scale, source=None, source_scale=1.0):
+    """
+    按比例缩放图片，尺寸过小时返回None
+    :param source: 可选的已缩小的中间图片，从它开始缩放以减少计算量
+    :param source_scale: 中间图片相对 img 的比例
+    """
+    new_width = int(img.width * scale)
+    new_height = int(img.height * scale)
+    # 避免尺寸过小
+    if new_width < 10 or new_height < 10:
+        return None
+    if source is None or source_scale < scale:
+        source = img
+    return source.resize((new_width, new_height), Image.LANCZOS)
+
+
+def optimize_scale_quality(img, fmt, target_bytes, min_quality, max_quality, full_sizes=None,
+                           min_scale=0.1, scale_tolerance=0.02, progress_callback=None, workers=1,
+                           predictor=None, base_scale=1.0, cancel=None, tracer=None, size_tolerance=0.02):
+    """
+    联合搜索缩放比例和质量，找到满足目标大小且丢失像素最少的组合
+    先在质量下限 min_quality 处用 大小 ≈ 原尺寸大小 × 缩放^α 的模型预测缩放比例，
+    每次试编码后用实测结果修正 α 并收窄区间，区间小于 scale_tolerance、
+    满足要求的大小与目标相差不到 size_tolerance 或模型预计已没有余量时停止；
+    再在选定的尺寸上查找能满足要求的最高质量，利用尺寸取整留下的余量
+    缩放时从逐级减半的金字塔中比例最接近的一级开始，每一级由上一级 reduce 得到，
+    不再需要的大尺寸级别会及时释放；调色板等图片先转换为 RGB/RGBA 再缩放，调色板格式在编码时重新量化
+    :param img: 已解码的图片
+    :param fmt: 编码格式
+    :param target_bytes: 目标大小(字节)
+    :param min_quality: 缩放阶段可接受的最低质量
+    :param max_quality: 最高质量
+    :param full_sizes: 原尺寸下已测得的 {质量: 大小}，用于初始化大小模型
+    :param min_scale: 最小缩放比例
+    :param scale_tolerance: 缩放比例的搜索精度
+    :param size_tolerance: 满足要求的大小达到目标的 (1 - size_tolerance) 时不再放大
+    :param progress_callback: 进度回调函数
+    :param workers: 查找质量时同时试编码的线程数
+    :param predictor: 可选的 SizePredictor，用它预测第一次尝试的缩放比例和最终质量
+    :param base_scale: img 相对原图的缩放比例，与 predictor 交互时使用
+    :param cancel: 可选的取消标记，每次缩放和编码前检查
+    :param tracer: 可选的 Tracer，记录每次缩放和试编码
+    :return: (缩放比例, 质量, 编码数据, 试编码次数)，无法满足时数据为None
+    """
+    trials = 0
+    img = resample_image(img)
+    min_scale = max(min_scale, 10 / min(img.width, img.height))
+
+    # 原尺寸下 min_quality 的大小：已测得则直接用，否则按对数在已知点之间插值，都没有时实测一次
+    full_sizes = full_sizes or {}
+    if full_sizes:
+        ref_size = estimate_size(full_sizes, min_quality)
+    else:
+        ref_size = len(encode_image(img, fmt, min_quality, tracer, scale=base_scale))
+        trials += 1
+    ref_scale = 1.0
+
+    # lo 为已知满足要求的最大缩放，hi 为已知超出的最小缩放
+    lo, lo_img, lo_data = None, None, None
+    hi = 1.0
+    alpha = 2.0  # 大小约与像素数成正比
+    first = True
+
+    # 逐级减半的金字塔 [(比例, 图片)]
+    levels = [(1.0, img)]
+
+    def level_for(scale):
+        # 找到比例不小于 scale 的最小一级，需要时由上一级继续减半
+        while levels[-1][0] / 2 >= scale and min(levels[-1][1].size) >= 40:
+            level_scale, level = levels[-1]
+            levels.append((level_scale / 2, level.reduce(2)))
+        for level_scale, level in reversed(levels):
+            if level_scale >= scale:
+                return level_scale, level
+        return levels[0]
+
+    while True:
+        floor = lo if lo is not None else min_scale
+        if hi - floor <= scale_tolerance:
+            if lo is not None:
+                break
+            # 区间已缩到最小缩放附近，最后试一次最小缩放
+            scale = min_scale
+        else:
+            # 用大小模型预测刚好满足要求的缩放比例；第一次尝试优先用探针预测
+            predicted = ref_scale * (target_bytes / ref_size) ** (1 / alpha)
+            if predictor is not None and first:
+                predicted = predictor.scale_for(target_bytes, min_quality) / base_scale
+            first = False
+            if ref_scale != lo:
+                # 由超出目标的实测(或原尺寸)预测时略微保守，尽量一次满足；
+                # 由满足要求的实测预测时不必保守，超出也只是收窄区间
+                predicted *= 0.98
+            if floor < predicted < hi:
+                scale = predicted
+            elif lo is not None and ref_scale == lo and predicted <= lo:
+                # 由满足要求的那次实测预测，已没有放大的余量
+                break
+            elif lo is None and predicted <= min_scale:
+                # 预计要缩到最小缩放以下，直接试最小缩放，仍超出就结束
+                scale = min_scale
+            else:
+                scale = (floor + hi) / 2
+
+        check_cancel(cancel)
+        with trace_span(tracer, 'resize', scale=scale * base_scale) as span:
+            level_scale, level = level_for(scale)
+            resized = resize_image(img, scale, level, level_scale)
+            span.update(source_scale=level_scale * base_scale, width=resized and resized.width,
+                        height=resized and resized.height)
+        if resized is None:
+            break
+        data = encode_image(resized, fmt, min_quality, tracer, scale=scale * base_scale)
+        trials += 1
+        if predictor is not None:
+            predictor.observe(min_quality, scale * base_scale, len(data))
+        size_kb = len(data) / 1024
+        if progress_callback:
+            progress = 50 + min(40, trials * 8)
+            progress_callback(progress, f"尝试缩放: {scale*100:.1f}%, 质量: {describe_quality(fmt, min_quality)}, "
+                                        f"大小: {size_kb:.1f}KB")
+
+        # 用两次实测结果修正模型指数
+        if scale != ref_scale and len(data) != ref_size:
+            fitted = math.log(len(data) / ref_size) / math.log(scale / ref_scale)
+            alpha = max(0.5, min(3.0, fitted))
+        ref_scale, ref_size = scale, len(data)
+
+        if len(data) <= target_bytes:
+            lo, lo_img, lo_data = scale, resized, data
+            if len(data) >= (1 - size_tolerance) * target_bytes:
+                break
+        else:
+            hi = scale
+            if scale <= min_scale:
+                break
+            # 比 hi 大一倍以上的级别以后用不到了
+            while len(levels) > 1 and levels[1][0] >= hi:
+                levels.pop(0)
+
+    if lo is None:
+        return None, None, None, trials
+
+    # 在选定尺寸上查找最高质量
+    guess = None
+    if predictor is not None:
+        guess = predictor.quality_for(target_bytes, min_quality, max_quality, lo * base_scale)
+    quality, data, quality_trials = search_quality(
+        lo_img, fmt, target_bytes, min_quality, max_quality, progress_callback,
+        lower=(min_quality, lo_data), progress_range=(90, 99), workers=workers,
+        guess=guess, predictor=predictor, scale=lo * base_scale, cancel=cancel, tracer=tracer
+    )
+    return lo, quality, data, trials + quality_trials
+
+
+def default_cache_dir():
+    """默认的缓存目录"""
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'py-tool', 'image_cache')
+
+
+class CompressionCache:
+    """
+    按内容寻址的压缩结果缓存
+    键为输入文件内容的SHA-256加上压缩参数，每个条目保存最终参数，可选保存输出数据，
+    按最近使用时间淘汰，总大小超过上限时删除最久未使用的条目。
+    每个条目单独一个文件并原子替换写入，多个进程可以共用同一个缓存目录。
+    总大小在内存中累计，只在估计值超过上限或每写入 RESCAN_PUTS 个条目时扫描整个目录，
+    其他进程写入的条目在下次扫描时计入
+    """
+    # 压缩算法有变化时修改版本号，使旧缓存失效
+    VERSION = 2
+    # 两次完整扫描之间最多写入的条目数
+    RESCAN_PUTS = 200
+    # 超过上限时淘汰到上限的这个比例，留出余量，缓存写满后不会每次写入都扫描
+    EVICT_RATIO = 0.9
+
+    def __init__(self, cache_dir=None, max_mb=500, store_output=True):
+        """
+        :param cache_dir: 缓存目录，默认为 default_cache_dir()
+        :param max_mb: 缓存总大小上限(MB)
+        :param store_output: 是否保存输出数据，否则只保存参数，命中时需要再编码一次
+        """
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_mb * 1024 * 1024
+        self.store_output = store_output
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 上次扫描得到的总大小加上之后写入的字节数，未扫描过时为None
+        self._total = None
+        self._puts = 0
+
+    def make_key(self, input_path, *params):
+        """由输入文件内容和压缩参数生成缓存键"""
+        digest = hashlib.sha256()
+        with open(input_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(json.dumps([self.VERSION] + list(params)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.cache_dir, key[:2], key + suffix)
+
+    def get(self, key):
+        """返回缓存的参数字典，未命中时返回None"""
+        path = self._path(key, '.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            # 用修改时间记录最近使用时间
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def load_output(self, key):
+        """返回缓存的输出数据，没有保存时返回None"""
+        path = self._path(key, '.bin')
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, entry, data=None):
+        """保存一个条目，估计的总大小超过上限或距上次扫描写入较多条目时淘汰旧条目"""
+        os.makedirs(os.path.dirname(self._path(key, '')), exist_ok=True)
+        written = 0
+        if data is not None and self.store_output:
+            written += self._write(self._path(key, '.bin'), data)
+        written += self._write(self._path(key, '.json'), json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+        self._puts += 1
+        if self._total is not None:
+            # 覆盖已有条目时会多算，只会让扫描提前
+            self._total += written
+        if self._total is None or self._total > self.max_bytes or self._puts >= self.RESCAN_PUTS:
+            self.evict()
+
+    def _write(self, path, data):
+        # 先写临时文件再替换，避免其他进程读到写了一半的文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def evict(self):
+        """扫描缓存目录，总大小超过上限时删除最久未使用的条目，直到低于上限的 EVICT_RATIO"""
+        self._puts = 0
+        entries = {}
+        total = 0
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for item in os.scandir(sub.path):
+                key, ext = os.path.splitext(item.name)
+                if ext not in ('.json', '.bin'):
+                    continue
+                st = item.stat()
+                total += st.st_size
+                used, size = entries.get(key, (0, 0))
+                entries[key] = (max(used, st.st_mtime), size + st.st_size)
+        self._total = total
+        if total <= self.max_bytes:
+            return
+        for key, (used, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+            for suffix in ('.json', '.bin'):
+                try:
+                    os.remove(self._path(key, suffix))
+                except OSError:
+                    pass
+            total -= size
+            if total <= self.max_bytes * self.EVICT_RATIO:
+                break
+        self._total = total
+
+
+def compress_image(input_path, output_path, target_kb=500, max_quality=85, min_quality=5, progress_callback=None,
+                   stats=None, scale_min_quality=75, workers=1, max_memory_mb=None, cache=None, predict=True,
+                   cancel=None, tracer=None, formats=None):
     """
     压缩图片到指定大小
     :param input_path: 输入图片路径
@@ -15,425 +984,501 @@ def compress_image(input_path, output_path, target_kb=500, max_quality=85, min_q
     :param max_quality: 起始质量(85-95为最佳平衡点)
     :param min_quality: 最低质量(避免过度失真)
     :param progress_callback: 进度回调函数
+    :param stats: 可选的字典，用于返回试编码次数、最终质量、缩放比例和大小
+    :param scale_min_quality: 需要缩小尺寸时可接受的最低质量
+    :param workers: 同时试编码的线程数，大于1时在多核机器上降低单张图片的耗时
+    :param max_memory_mb: 解码后图片占用内存的上限(MB)，超大图片会在解码时直接缩小
+    :param cache: 可选的 CompressionCache，相同输入和参数再次压缩时直接使用缓存结果
+    :param predict: 是否先用小探针图预测大小，直接从接近目标的质量和缩放比例开始尝试
+    :param cancel: 可选的取消标记(threading.Event 或 multiprocessing.Event)，每次编码前检查，设置后尽快返回
+    :param tracer: 可选的 Tracer，记录解码、试编码、缩放、写出等各阶段的耗时
+    :param formats: 输出格式，None 表示按输出文件扩展名；'auto' 或格式列表表示逐个尝试，
+                    选缩放最少、文件最小的一种(缩放比例不如已有结果的格式提前放弃)，扩展名与所选格式不同时改用该格式的扩展名
+                    (实际路径见 stats['output'])
+    """
+    if stats is None:
+        stats = {}
+    stats.update(trials=0, quality=None, scale=1.0, size=None, peak_rss=None, cached=False, predictions=[],
+                 cancelled=False, format=None, output=output_path)
+    with trace_span(tracer, 'compress', input=input_path, target_kb=target_kb) as span:
+        success, message = _compress_image(
+            input_path, output_path, target_kb, max_quality, min_quality, progress_callback, stats,
+            scale_min_quality, workers, max_memory_mb, cache, predict, cancel, tracer, formats
+        )
+        span.update(success=success, format=stats['format'], trials=stats['trials'], quality=stats['quality'],
+                    scale=stats['scale'],
+                    bytes=stats['size'], cached=stats['cached'], peak_rss=stats['peak_rss'])
+    return success, message
+
+
+def _compress_format(load, input_path, fmt, target_bytes, min_quality, max_quality, scale_min_quality,
+                     progress_callback, stats, workers, max_memory_mb, predict, cancel, tracer, min_scale=None):
     """
+    用一种输出格式压缩: 先只调整质量(有损格式的质量或调色板颜色数)，不满足时联合搜索缩放比例和质量
+    :param load: 返回 open_image 结果的函数，只调用一次；调用方不保留其他引用时，重新解码后原尺寸图片可以释放
+    :param min_scale: 多种格式比较时已有结果的缩放比例(相对原图)，需要缩得比它小 1% 以上才能满足时不再搜索
+    :return: (编码数据, 格式, 质量, 相对原图的缩放比例, 尺寸, 说明)，无法满足时返回None
+    """
+    img, _, base_scale = load()
+    img = prepare_image(img, fmt, tracer)
+    min_quality, max_quality = quality_range(fmt, min_quality, max_quality)
+
+    # 大图先用探针预测接近目标的质量，只对有损格式有效；
+    # 探针本身要编码几十次缩略图，所以先试一次最高质量，已满足要求时不再建探针
+    predictor = guess = quality = data = None
+    full_sizes = {}
+    search_max = max_quality
+    if predict and fmt in LOSSY_FORMATS and img.width * img.height >= SizePredictor.MIN_PIXELS:
+        check_cancel(cancel)
+        first = encode_image(img, fmt, max_quality, tracer, scale=base_scale)
+        stats['trials'] += 1
+        full_sizes[max_quality] = len(first)
+        if progress_callback:
+            progress_callback(5, f"尝试质量: {describe_quality(fmt, max_quality)}, "
+                                 f"当前大小: {len(first) / 1024:.1f}KB")
+        if len(first) <= target_bytes:
+            quality, data = max_quality, first
+        else:
+            with trace_span(tracer, 'probe', format=fmt) as span:
+                predictor = SizePredictor(img, fmt, min_quality, max_quality, base_scale)
+                span['encodes'] = predictor.probe_encodes
+            stats['trials'] += predictor.probe_encodes
+            predictor.observe(max_quality, base_scale, len(first))
+            stats['predictions'] = predictor.history
+            # 最高质量已知超出，只在更低的质量里搜索
+            search_max = max_quality - 1
+            guess = predictor.quality_for(target_bytes, min_quality, search_max, base_scale)
+
+    # 尝试仅通过调整质量压缩
+    if data is None and search_max >= min_quality:
+        quality, data, trials = search_quality(
+            img, fmt, target_bytes, min_quality, search_max, progress_callback,
+            sizes=full_sizes, workers=workers, guess=guess, predictor=predictor, scale=base_scale, cancel=cancel,
+            tracer=tracer
+        )
+        stats['trials'] += trials
+    if data is not None:
+        if fmt == 'PNG':
+            data = optimize_png(data, tracer)
+        size_kb = len(data) / 1024
+        return (data, fmt, quality, base_scale, img.size,
+                f"质量压缩成功: {describe_quality(fmt, quality)}, 大小: {size_kb:.2f}KB")
+
+    if min_scale is not None and round(min_scale, 2) >= round(base_scale, 2):
+        # 其他格式不缩放就已满足要求，缩放后不可能更优
+        return None
+
+    # 如果质量压缩失败，联合搜索缩放比例和质量
+    scale_min_quality = max(min_quality, min(scale_min_quality, max_quality))
+    if fmt in PALETTE_FORMATS:
+        # 调色板格式取不高于它的档位，没有时取最低档
+        scale_min_quality = (palette_levels(min_quality, scale_min_quality)
+                             or palette_levels(min_quality, max_quality)[-1:])[0]
+    if predictor is not None:
+        predicted = predictor.scale_for(target_bytes, scale_min_quality) / base_scale
+    else:
+        predicted = math.sqrt(target_bytes / estimate_size(full_sizes, scale_min_quality))
+    if predicted * 2 <= 0.5:
+        # 预计要缩得很小时，按两倍余量重新以低分辨率解码，释放原尺寸图片
+        ratio = base_scale
+        del img
+        img, _, base_scale = open_image(
+            input_path, scale=ratio * predicted * 2, max_memory_mb=max_memory_mb, tracer=tracer
+        )
+        img = prepare_image(img, fmt, tracer)
+        ratio = base_scale / ratio
+        full_sizes = {q: size * ratio ** 2 for q, size in full_sizes.items()}
+    lowest = min(1.0, 0.1 / base_scale)
+    if min_scale is not None:
+        lowest = max(lowest, (min_scale - 0.01) / base_scale)
+    scale, quality, data, trials = optimize_scale_quality(
+        img, fmt, target_bytes, scale_min_quality, max_quality,
+        full_sizes=full_sizes, min_scale=lowest,
+        progress_callback=progress_callback, workers=workers, predictor=predictor, base_scale=base_scale,
+        cancel=cancel, tracer=tracer
+    )
+    stats['trials'] += trials
+    if data is None:
+        return None
+    if fmt == 'PNG':
+        data = optimize_png(data, tracer)
+    size = (int(img.width * scale), int(img.height * scale))
+    scale *= base_scale
+    size_kb = len(data) / 1024
+    return (data, fmt, quality, scale, size,
+            f"尺寸压缩成功: {scale*100:.1f}%, 质量: {describe_quality(fmt, quality)}, 大小: {size_kb:.2f}KB")
+
+
+def _compress_image(input_path, output_path, target_kb, max_quality, min_quality, progress_callback, stats,
+                    scale_min_quality, workers, max_memory_mb, cache, predict, cancel, tracer, formats):
+    """compress_image 的实现，参数含义相同"""
     try:
         # 检查文件是否存在
         if not os.path.exists(input_path):
             return False, "源文件不存在"
         
-        # 检查文件大小是否已满足要求
-        file_size = os.path.getsize(input_path)
-        if file_size <= target_kb * 1024:
-            Image.open(input_path).save(output_path)
-            if progress_callback:
-                progress_callback(100, "图片已小于目标大小，无需压缩", True)
-            return True, "图片已小于目标大小，无需压缩"
+        target_bytes = target_kb * 1024
+        # 查找缓存之后才有缓存键，之前调用 finish 时不写缓存
+        cache_key = None
 
-        img = Image.open(input_path)
-        original_format = img.format
-        
-        # 处理透明通道（转换为JPEG需要RGB）
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
-            original_format = 'JPEG'
-
-        # 尝试仅通过调整质量压缩
-        quality = max_quality
-        while quality >= min_quality:
-            buffer = io.BytesIO()
-            img.save(buffer, format=original_format, quality=quality)
-            size_kb = len(buffer.getvalue()) / 1024
-            
-            # 计算当前进度百分比
-            progress = int((max_quality - quality) / (max_quality - min_quality) * 50)
+        def finish(data, fmt, quality, scale, size, summary):
+            path = output_path
+            if format_for_path(path) not in (None, fmt):
+                path = os.path.splitext(path)[0] + FORMAT_EXTENSIONS[fmt]
+            with trace_span(tracer, 'write', bytes=len(data)):
+                with open(path, 'wb') as f:
+                    f.write(data)
+            stats.update(format=fmt, quality=quality, scale=scale, size=len(data), output=path)
+            if cache_key is not None and not stats['cached']:
+                cache.put(cache_key, dict(format=fmt, quality=quality, scale=scale, width=size[0], height=size[1],
+                                          summary=summary), data)
+            message = f"{summary}, 试编码 {stats['trials']} 次" if stats['trials'] else summary
+            if stats['cached']:
+                message = f"命中缓存, {summary}"
             if progress_callback:
-                progress_callback(progress, f"尝试质量: {quality}%, 当前大小: {size_kb:.1f}KB")
-            
-            if size_kb <= target_kb:
-                with open(output_path, 'wb') as f:
-                    f.write(buffer.getvalue())
-                if progress_callback:
-                    progress_callback(100, f"质量压缩成功: {quality}%, 大小: {size_kb:.2f}KB", True)
-                return True, f"质量压缩成功: {quality}%, 大小: {size_kb:.2f}KB"
-            
-            # 质量调整步长根据剩余空间动态变化
-            quality_step = max(1, min(5, int((size_kb - target_kb) / 50)))  # 限制步长范围
-            quality -= quality_step
-        
-        # 如果质量压缩失败，启用尺寸缩减
-        scale_factor = 0.9  # 每次缩小10%
-        while scale_factor >= 0.1:  # 最小缩放到原图的10%
-            # 计算新尺寸
-            new_width = int(img.width * scale_factor)
-            new_height = int(img.height * scale_factor)
-            
-            # 避免尺寸过小
-            if new_width < 10 or new_height < 10:
-                break
-                
-            resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-            
-            buffer = io.BytesIO()
-            resized_img.save(buffer, format=original_format, quality=85)  # 使用中等质量
-            
-            size_kb = len(buffer.getvalue()) / 1024
-            
-            # 更新进度条 (50%-100%)
-            progress = 50 + int((0.9 - scale_factor) / (0.9 - 0.1) * 50)
-            if progress_callback:
-                progress_callback(progress, f"尝试缩放: {scale_factor*100:.1f}%, 大小: {size_kb:.1f}KB")
-            
-            if size_kb <= target_kb:
-                with open(output_path, 'wb') as f:
-                    f.write(buffer.getvalue())
-                if progress_callback:
-                    progress_callback(100, f"尺寸压缩成功: {scale_factor*100:.1f}%, 大小: {size_kb:.2f}KB", True)
-                return True, f"尺寸压缩成功: {scale_factor*100:.1f}%, 大小: {size_kb:.2f}KB"
-            
-            scale_factor = round(scale_factor * 0.9, 2)  # 继续缩小
-
-        return False, "无法压缩到目标大小，建议使用专业工具处理"
+                progress_callback(100, message, True)
+            return True, message
+
+        # 已小于目标大小时不压缩: 输出格式与源格式相同时原样复制，否则按最高质量转换一次，仍满足要求即可
+        if os.path.getsize(input_path) <= target_bytes:
+            with Image.open(input_path) as img:
+                # 多帧 JPEG(MPO) 按普通 JPEG 处理
+                source_format = 'JPEG' if img.format == 'MPO' else img.format
+                candidates = choose_formats(formats, output_path, img.format, img)
+                if source_format in candidates:
+                    with open(input_path, 'rb') as f:
+                        data = f.read()
+                    fmt, quality = source_format, None
+                else:
+                    fmt = candidates[0]
+                    quality = quality_range(fmt, min_quality, max_quality)[1]
+                    data = encode_image(prepare_image(img, fmt, tracer), fmt, quality, tracer)
+                    stats['trials'] += 1
+                size = img.size
+            if len(data) <= target_bytes:
+                summary = "图片已小于目标大小，无需压缩"
+                if fmt != source_format:
+                    summary = f"{summary}, 格式: {fmt}"
+                return finish(data, fmt, quality, 1.0, size, summary)
+
+        # 查找缓存，命中时无需重新搜索
+        if cache is not None:
+            cache_key = cache.make_key(input_path, target_kb, max_quality, min_quality, scale_min_quality,
+                                       os.path.splitext(output_path)[1].lower(), formats)
+            with trace_span(tracer, 'cache_lookup') as span:
+                entry = cache.get(cache_key)
+                span['hit'] = entry is not None
+            if entry is not None:
+                data = cache.load_output(cache_key)
+                if data is None:
+                    # 只缓存了参数时按参数编码一次
+                    img, _, _ = open_image(input_path, scale=entry['scale'], max_memory_mb=max_memory_mb,
+                                           tracer=tracer)
+                    img = prepare_image(img, entry['format'], tracer)
+                    if img.size != (entry['width'], entry['height']):
+                        with trace_span(tracer, 'resize', scale=entry['scale'], width=entry['width'],
+                                        height=entry['height']):
+                            img = resample_image(img).resize((entry['width'], entry['height']), Image.LANCZOS)
+                    data = encode_image(img, entry['format'], entry['quality'], tracer, scale=entry['scale'])
+                    stats['trials'] += 1
+                if len(data) <= target_bytes:
+                    stats['cached'] = True
+                    return finish(data, entry['format'], entry['quality'], entry['scale'],
+                                  (entry['width'], entry['height']), entry['summary'])
+
+        check_cancel(cancel)
+        decoded = [open_image(input_path, max_memory_mb=max_memory_mb, tracer=tracer)]
+        check_cancel(cancel)
+        candidates = choose_formats(formats, output_path, decoded[0][1], decoded[0][0])
+
+        results = []
+        best_scale = None
+        for fmt in candidates:
+            # 只有一种格式时把解码结果交给 _compress_format 独占，需要重新解码时原尺寸图片可以及时释放
+            load = decoded.pop if len(candidates) == 1 else (lambda: decoded[0])
+            # 已有结果后，后面的格式缩放比例不如它时提前放弃，也不再为它建探针(探针的几十次编码省不回来)
+            result = _compress_format(
+                load, input_path, fmt, target_bytes, min_quality, max_quality, scale_min_quality,
+                progress_callback, stats, workers, max_memory_mb, predict and not results, cancel, tracer,
+                min_scale=best_scale
+            )
+            if result is not None:
+                results.append(result)
+                best_scale = max(best_scale or 0, result[3])
+        decoded.clear()
+
+        if not results:
+            return False, "无法压缩到目标大小，建议使用专业工具处理"
+        # 优先保留更多像素(缩放比例相差不到 1% 视为相同)，其次选更小的文件；
+        # 不同格式的质量数值含义不同(调色板颜色数、JPEG/WebP 质量)，不能互相比较
+        data, fmt, quality, scale, size, summary = max(results, key=lambda r: (round(r[3], 2), -len(r[0])))
+        if len(candidates) > 1:
+            summary = f"{summary}, 格式: {fmt}"
+        return finish(data, fmt, quality, scale, size, summary)
     
+    except CompressionCancelled:
+        stats['cancelled'] = True
+        return False, "已取消压缩"
     except Exception as e:
         import traceback
         traceback.print_exc()
         return False, f"处理过程中出错: {str(e)}"
+    finally:
+        stats['peak_rss'] = peak_rss()
 
 
-class ImageCompressorApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("图片压缩工具")
-        self.root.geometry("650x750")  # 增加窗口大小
-        self.root.resizable(True, True)
-        self.root.minsize(600, 500)  # 设置最小尺寸
-        
-        # 设置图标（如果存在）
-        self.set_icon()
-        
-        # 创建UI
-        self.create_widgets()
-        
-        # 初始化变量
-        self.input_path = ""
-        self.output_path = ""
-        self.compression_thread = None
-        
-    def set_icon(self):
-        """尝试设置应用图标"""
-        try:
-            # 尝试从可执行文件所在目录加载图标
-            if getattr(sys, 'frozen', False):
-                base_path = os.path.dirname(sys.executable)
-            else:
-                base_path = os.path.dirname(os.path.abspath(__file__))
-                
-            icon_path = os.path.join(base_path, "app_icon.ico")
-            if os.path.exists(icon_path):
-                self.root.iconbitmap(icon_path)
-        except Exception:
-            pass
-        
-    def create_widgets(self):
-        # 创建主框架
-        main_frame = ttk.Frame(self.root, padding=15)
-        main_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # 文件选择部分
-        file_frame = ttk.LabelFrame(main_frame, text="文件选择", padding=10)
-        file_frame.pack(fill=tk.X, pady=5)
-        
-        # 输入文件
-        input_frame = ttk.Frame(file_frame)
-        input_frame.pack(fill=tk.X, pady=5)
-        ttk.Label(input_frame, text="源文件:", width=8).pack(side=tk.LEFT)
-        self.input_entry = ttk.Entry(input_frame)
-        self.input_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
-        ttk.Button(input_frame, text="浏览...", command=self.browse_input, width=8).pack(side=tk.RIGHT)
-        
-        # 输出文件
-        output_frame = ttk.Frame(file_frame)
-        output_frame.pack(fill=tk.X, pady=5)
-        ttk.Label(output_frame, text="输出文件:", width=8).pack(side=tk.LEFT)
-        self.output_entry = ttk.Entry(output_frame)
-        self.output_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
-        ttk.Button(output_frame, text="浏览...", command=self.browse_output, width=8).pack(side=tk.RIGHT)
-        
-        # 压缩设置
-        settings_frame = ttk.LabelFrame(main_frame, text="压缩设置", padding=10)
-        settings_frame.pack(fill=tk.X, pady=10)
-        
-        # 目标大小设置
-        target_frame = ttk.Frame(settings_frame)
-        target_frame.pack(fill=tk.X, pady=5)
-        ttk.Label(target_frame, text="目标大小 (KB):", width=15).pack(side=tk.LEFT)
-        self.target_var = tk.IntVar(value=500)
-        ttk.Entry(target_frame, textvariable=self.target_var, width=10).pack(side=tk.LEFT, padx=5)
-        
-        # 质量设置
-        quality_frame = ttk.Frame(settings_frame)
-        quality_frame.pack(fill=tk.X, pady=5)
-        ttk.Label(quality_frame, text="最高质量:", width=15).pack(side=tk.LEFT)
-        self.max_quality_var = tk.IntVar(value=85)
-        quality_scale = ttk.Scale(
-            quality_frame, 
-            from_=70, 
-            to=100, 
-            variable=self.max_quality_var,
-            orient=tk.HORIZONTAL,
-            length=200
-        )
-        quality_scale.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
-        ttk.Label(quality_frame, textvariable=self.max_quality_var, width=3).pack(side=tk.LEFT, padx=(0, 5))
-        
-        # 预览区域
-        preview_frame = ttk.LabelFrame(main_frame, text="图片预览", padding=10)
-        preview_frame.pack(fill=tk.BOTH, expand=True, pady=10)
-        
-        # 创建画布用于预览
-        self.preview_canvas = tk.Canvas(preview_frame, bg='#f0f0f0', height=250)
-        self.preview_canvas.pack(fill=tk.BOTH, expand=True)
-        
-        # 预览占位文本
-        self.preview_text = self.preview_canvas.create_text(
-            150, 100, 
-            text="选择图片后将显示预览",
-            font=("Arial", 10),
-            fill="#999999"
-        )
-        
-        # 进度条
-        progress_frame = ttk.Frame(main_frame)
-        progress_frame.pack(fill=tk.X, pady=10)
-        
-        self.progress_var = tk.IntVar()
-        self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, maximum=100)
-        self.progress_bar.pack(fill=tk.X, expand=True)
-        
-        # 状态信息
-        self.status_var = tk.StringVar(value="准备就绪")
-        status_label = ttk.Label(main_frame, textvariable=self.status_var)
-        status_label.pack(fill=tk.X, pady=(0, 10))
-        
-        # 操作按钮
-        button_frame = ttk.Frame(main_frame)
-        button_frame.pack(fill=tk.X, pady=10)
-        
-        # 使用grid布局按钮以确保正确显示
-        ttk.Button(button_frame, text="开始压缩", command=self.start_compression, width=15).grid(row=0, column=0, padx=5)
-        ttk.Button(button_frame, text="打开输出文件夹", command=self.open_output_dir, width=15).grid(row=0, column=1, padx=5)
-        ttk.Button(button_frame, text="退出", command=self.root.quit, width=10).grid(row=0, column=2, padx=5)
-        
-        # 配置列权重，使按钮居中
-        button_frame.columnconfigure(0, weight=1)
-        button_frame.columnconfigure(1, weight=1)
-        button_frame.columnconfigure(2, weight=1)
-        
-    def browse_input(self):
-        file_path = filedialog.askopenfilename(
-            title="选择源图片",
-            filetypes=[
-                ("图片文件", "*.jpg *.jpeg *.png *.bmp *.gif"),
-                ("所有文件", "*.*")
-            ]
-        )
-        if file_path:
-            self.input_path = file_path
-            self.input_entry.delete(0, tk.END)
-            self.input_entry.insert(0, file_path)
-            
-            # 自动生成输出路径
-            dir_name, file_name = os.path.split(file_path)
-            name, ext = os.path.splitext(file_name)
-            self.output_path = os.path.join(dir_name, f"{name}_compressed{ext}")
-            self.output_entry.delete(0, tk.END)
-            self.output_entry.insert(0, self.output_path)
-            
-            # 显示预览
-            self.show_preview(file_path)
-    
-    def show_preview(self, file_path):
-        """显示图片预览"""
-        try:
-            # 清除之前的预览
-            self.preview_canvas.delete("preview")
-            self.preview_canvas.itemconfig(self.preview_text, text="")
-            
-            img = Image.open(file_path)
-            # 调整大小以适应预览区域
-            canvas_width = self.preview_canvas.winfo_width()
-            canvas_height = self.preview_canvas.winfo_height()
-            
-            if canvas_width < 10 or canvas_height < 10:
-                canvas_width, canvas_height = 300, 250
-            
-            width, height = img.size
-            ratio = min(canvas_width/width, canvas_height/height)
-            new_size = (int(width * ratio), int(height * ratio))
-            img = img.resize(new_size, Image.LANCZOS)
-            
-            # 将图像转换为PhotoImage
-            photo = ImageTk.PhotoImage(img)
-            
-            # 在画布中央显示图像
-            self.preview_canvas.image = photo  # 保持引用
-            self.preview_canvas.create_image(
-                canvas_width//2, 
-                canvas_height//2, 
-                image=photo, 
-                anchor=tk.CENTER,
-                tags="preview"
-            )
-            
-            # 显示图片信息
-            file_size = os.path.getsize(file_path) / 1024
-            self.status_var.set(f"已加载图片: {width}×{height} 分辨率, 大小: {file_size:.1f}KB")
-            
-            # 绑定画布大小变化事件
-            self.preview_canvas.bind("<Configure>", lambda e: self.update_preview(file_path))
-            
-        except Exception as e:
-            self.preview_canvas.itemconfig(self.preview_text, text=f"无法加载预览: {str(e)}")
-            self.status_var.set(f"加载预览失败: {str(e)}")
-    
-    def update_preview(self, file_path):
-        """当画布大小变化时更新预览"""
-        if self.input_path:
-            self.show_preview(self.input_path)
-    
-    def browse_output(self):
-        if not self.input_path:
-            messagebox.showerror("错误", "请先选择源文件")
-            return
-            
-        initial_dir, initial_file = os.path.split(self.output_path if self.output_path else self.input_path)
-        file_path = filedialog.asksaveasfilename(
-            title="保存压缩图片",
-            initialdir=initial_dir,
-            initialfile=initial_file,
-            filetypes=[
-                ("JPEG文件", "*.jpg"),
-                ("PNG文件", "*.png"),
-                ("所有文件", "*.*")
-            ]
-        )
-        if file_path:
-            self.output_path = file_path
-            self.output_entry.delete(0, tk.END)
-            self.output_entry.insert(0, file_path)
-    
-    def start_compression(self):
-        if not self.input_path or not os.path.exists(self.input_path):
-            messagebox.showerror("错误", "请选择有效的源文件")
-            return
-            
-        if not self.output_path:
-            messagebox.showerror("错误", "请指定输出文件路径")
-            return
-            
-        # 禁用按钮避免重复点击
-        self.root.config(cursor="watch")
-        for widget in self.root.winfo_children():
-            if isinstance(widget, ttk.Button) and widget["text"] != "退出":
-                widget.state(['disabled'])
-        
-        # 重置进度
-        self.progress_var.set(0)
-        self.status_var.set("开始压缩...")
-        
-        # 在新线程中执行压缩
-        self.compression_thread = threading.Thread(
-            target=self.run_compression,
-            args=(self.input_path, self.output_path),
-            daemon=True
-        )
-        self.compression_thread.start()
-        
-        # 检查线程状态
-        self.check_thread()
-    
-    def run_compression(self, input_path, output_path):
-        target_kb = self.target_var.get()
-        max_quality = self.max_quality_var.get()
-        
-        def progress_callback(progress, message, done=False):
-            self.root.after(100, lambda: self.update_progress(progress, message, done))
-        
+def collect_images(source):
+    """
+    收集要批量处理的图片
+    跳过本工具的输出(文件名以 _compressed 结尾，见 batch_output_path)，同一目录再次运行时不会重复压缩
+    :param source: 目录或通配符(如 photos/*.jpg)
+    :return: 排序后的图片路径列表
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS)
+                  and not os.path.splitext(os.path.basename(p))[0].endswith('_compressed'))
+
+
+def batch_output_path(input_path, output_dir=None):
+    """批量模式下的输出路径，与单文件模式一样加 _compressed 后缀"""
+    dir_name, file_name = os.path.split(input_path)
+    name, ext = os.path.splitext(file_name)
+    return os.path.join(output_dir or dir_name, f"{name}_compressed{ext}")
+
+
+# 子进程中的取消标记，由进程池的 initializer 设置
+_worker_cancel = None
+
+
+def _init_worker(cancel):
+    global _worker_cancel
+    _worker_cancel = cancel
+
+
+def _compress_job(input_path, output_path, target_kb, max_quality, min_quality, cache, trace_path=None,
+                 formats=None, scale_min_quality=75, threads=1, max_memory_mb=None, predict=True):
+    """在子进程中压缩单个文件，返回可序列化的结果字典；threads 即 compress_image 的 workers"""
+    stats = {}
+    start = time.perf_counter()
+    with Tracer(trace_path, pid=os.getpid()) if trace_path else contextlib.nullcontext() as tracer:
         success, message = compress_image(
-            input_path, 
-            output_path,
-            target_kb=target_kb,
-            max_quality=max_quality,
-            progress_callback=progress_callback
+            input_path, output_path, target_kb=target_kb, max_quality=max_quality,
+            min_quality=min_quality, stats=stats, scale_min_quality=scale_min_quality, workers=threads,
+            max_memory_mb=max_memory_mb, cache=cache, predict=predict, cancel=_worker_cancel, tracer=tracer,
+            formats=formats
         )
-        
-        if not success:
-            self.root.after(100, lambda: self.compression_failed(message))
-    
-    def update_progress(self, progress, message, done):
-        self.progress_var.set(progress)
-        self.status_var.set(message)
-        if done:
-            self.compression_complete()
-    
-    def check_thread(self):
-        if self.compression_thread.is_alive():
-            self.root.after(100, self.check_thread)
+    stats.update(input=input_path, success=success, message=message,
+                 elapsed=time.perf_counter() - start)
+    return stats
+
+
+def compress_batch(inputs, output_dir=None, target_kb=500, max_quality=85, min_quality=5, workers=None,
+                   cache=None, cancel=None, trace_path=None, formats=None, scale_min_quality=75, threads=1,
+                   max_memory_mb=None, predict=True):
+    """
+    用多进程批量压缩图片，每完成一个文件就产出一条结果
+    :param inputs: 图片路径列表
+    :param output_dir: 输出目录，为None时输出到源文件所在目录
+    :param target_kb: 目标大小(KB)
+    :param max_quality: 起始质量
+    :param min_quality: 最低质量
+    :param workers: 进程数，默认为CPU核数
+    :param cache: 可选的 CompressionCache，各子进程共用同一个缓存目录
+    :param cancel: 可选的 multiprocessing.Event，设置后取消未开始的文件，正在压缩的文件在下次编码前停止
+    :param trace_path: 可选的 JSON lines 文件，各子进程把每个阶段的耗时追加到其中
+    :param formats: 输出格式，含义同 compress_image
+    :param scale_min_quality: 需要缩小尺寸时可接受的最低质量
+    :param threads: 每张图片同时试编码的线程数，即 compress_image 的 workers
+    :param max_memory_mb: 解码后图片占用内存的上限(MB)
+    :param predict: 是否使用探针预测大小
+    :return: 生成器，产出包含 input、output、success、message、quality、scale、size、trials、elapsed 的字典
+    """
+    # 多进程相关模块导入较慢，只在批量时导入
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, max(1, len(inputs))),
+                             initializer=_init_worker, initargs=(cancel,)) as executor:
+        futures = {}
+        for input_path in inputs:
+            output_path = batch_output_path(input_path, output_dir)
+            future = executor.submit(_compress_job, input_path, output_path, target_kb, max_quality, min_quality,
+                                     cache, trace_path, formats, scale_min_quality=scale_min_quality,
+                                     threads=threads, max_memory_mb=max_memory_mb, predict=predict)
+            futures[future] = (input_path, output_path)
+        pending = set(futures)
+        while pending:
+            # 定时醒来检查取消标记
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                for future in pending:
+                    future.cancel()
+            for future in done:
+                try:
+                    yield future.result()
+                except Exception as e:
+                    # 已取消或子进程异常退出等情况
+                    input_path, output_path = futures[future]
+                    message = "已取消压缩" if future.cancelled() else f"处理过程中出错: {str(e)}"
+                    yield dict(input=input_path, output=output_path, success=False, message=message,
+                               trials=0, format=None, quality=None, scale=None, size=None, elapsed=0.0)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="压缩图片到指定大小。不带任何参数运行时打开图形界面。"
+    )
+    parser.add_argument('inputs', nargs='+', help="输入图片、目录或通配符，- 表示从标准输入读取")
+    parser.add_argument('-o', '--output', help="输出文件或目录，- 表示写到标准输出；默认在源文件旁加 _compressed 后缀")
+    parser.add_argument('-t', '--target-kb', type=int, default=500, help="目标大小(KB)，默认500")
+    parser.add_argument('--max-quality', type=int, default=85, help="起始质量，默认85")
+    parser.add_argument('--min-quality', type=int, default=5, help="最低质量，默认5")
+    parser.add_argument('--scale-min-quality', type=int, default=75, help="需要缩小尺寸时可接受的最低质量，默认75")
+    parser.add_argument('--threads', type=int, default=1, help="单张图片同时试编码的线程数，默认1")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="多个文件时的进程数，默认为CPU核数")
+    parser.add_argument('--max-memory-mb', type=int, default=None, help="解码后图片占用内存的上限(MB)")
+    parser.add_argument('--cache-dir', default=None, help="启用结果缓存并使用该目录")
+    parser.add_argument('--no-predict', action='store_true', help="不使用探针预测大小")
+    parser.add_argument('--format', choices=FORMAT_CHOICES, default='keep',
+                        help="输出格式：keep 按输出文件扩展名(默认)，auto 自动选择满足目标大小、缩放最少且文件最小的格式")
+    parser.add_argument('--json', action='store_true', help="每个文件输出一行JSON结果，最后输出一行汇总")
+    parser.add_argument('--trace', default=None, help="把每个阶段(解码、试编码、缩放、写出)的耗时按JSON lines追加到该文件")
+    return parser.parse_args(argv)
+
+
+def detected_extension(path):
+    """按文件头识别图片格式，返回对应的扩展名，无法识别时返回空字符串"""
+    try:
+        with Image.open(path) as img:
+            return FORMAT_EXTENSIONS.get(img.format, '')
+    except (OSError, ValueError):
+        return ''
+
+
+def formats_from_arg(value):
+    """把命令行 --format 的值转换为 compress_image 的 formats 参数"""
+    return None if value == 'keep' else 'auto' if value == 'auto' else [value]
+
+
+def _expand_inputs(inputs):
+    """把命令行中的输入展开为文件列表，目录和通配符按批量模式收集图片"""
+    paths = []
+    for item in inputs:
+        if item == '-' or os.path.isfile(item):
+            paths.append(item)
         else:
-            self.root.config(cursor="")
-    
-    def compression_complete(self):
-        # 启用按钮
-        for widget in self.root.winfo_children():
-            if isinstance(widget, ttk.Button) and widget["text"] != "退出":
-                widget.state(['!disabled'])
-        
-        # 显示结果
-        if os.path.exists(self.output_path):
-            size_kb = os.path.getsize(self.output_path) / 1024
-            messagebox.showinfo("压缩成功", 
-                               f"图片压缩完成!\n\n"
-                               f"输出文件: {os.path.basename(self.output_path)}\n"
-                               f"最终大小: {size_kb:.2f} KB")
-    
-    def compression_failed(self, message):
-        # 启用按钮
-        for widget in self.root.winfo_children():
-            if isinstance(widget, ttk.Button) and widget["text"] != "退出":
-                widget.state(['!disabled'])
-        
-        self.root.config(cursor="")
-        messagebox.showerror("压缩失败", message)
-    
-    def open_output_dir(self):
-        if self.output_path and os.path.exists(self.output_path):
-            output_dir = os.path.dirname(self.output_path)
-            os.startfile(output_dir)
-        elif self.input_path:
-            input_dir = os.path.dirname(self.input_path)
-            os.startfile(input_dir)
+            paths.extend(collect_images(item) or [item])
+    return paths
+
+
+def run_cli(argv):
+    """
+    命令行模式，不导入任何图形界面模块
+    :return: 退出码，全部成功为0，有文件失败为1，参数错误为2
+    """
+    args = parse_args(argv)
+    start = time.perf_counter()
+    import_seconds = start - _IMPORT_START
+    inputs = _expand_inputs(args.inputs)
+    to_stdout = args.output == '-'
+    # 结果写到标准输出时，提示信息改写到标准错误
+    report_stream = sys.stderr if to_stdout else sys.stdout
+
+    if to_stdout and len(inputs) != 1:
+        print("错误: 输出到标准输出时只能处理一个文件", file=sys.stderr)
+        return 2
+    if '-' in inputs and len(inputs) != 1:
+        print("错误: 从标准输入读取时只能处理一个文件", file=sys.stderr)
+        return 2
+
+    cache = CompressionCache(args.cache_dir) if args.cache_dir else None
+    formats = formats_from_arg(args.format)
+    failed = 0
+
+    def report(result):
+        nonlocal failed
+        if not result['success']:
+            failed += 1
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False), file=report_stream, flush=True)
         else:
-            messagebox.showerror("错误", "没有可用的输出目录")
+            print(f"{result['input']}: {result['message']}", file=report_stream, flush=True)
+
+    if len(inputs) == 1:
+        # 单个文件在本进程中处理，省去进程池的启动开销
+        input_path = inputs[0]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = input_path
+            if input_path == '-':
+                source = os.path.join(tmp_dir, 'stdin')
+                with open(source, 'wb') as f:
+                    shutil.copyfileobj(sys.stdin.buffer, f)
+                # 临时文件按检测到的格式加扩展名，保存时才能确定输出格式
+                named = source + detected_extension(source)
+                os.rename(source, named)
+                source = named
+            if to_stdout:
+                output_path = os.path.join(tmp_dir, 'stdout' + (os.path.splitext(source)[1]
+                                                                 or detected_extension(source)))
+            elif args.output and os.path.isdir(args.output):
+                output_path = batch_output_path(source, args.output)
+            elif args.output:
+                output_path = args.output
+            elif input_path == '-':
+                print("错误: 从标准输入读取时需要用 -o 指定输出", file=sys.stderr)
+                return 2
+            else:
+                output_path = batch_output_path(source)
+
+            stats = {}
+            job_start = time.perf_counter()
+            with Tracer(args.trace, pid=os.getpid()) if args.trace else contextlib.nullcontext() as tracer:
+                success, message = compress_image(
+                    source, output_path, target_kb=args.target_kb, max_quality=args.max_quality,
+                    min_quality=args.min_quality, stats=stats, scale_min_quality=args.scale_min_quality,
+                    workers=args.threads, max_memory_mb=args.max_memory_mb, cache=cache,
+                    predict=not args.no_predict, tracer=tracer, formats=formats
+                )
+            output_path = stats['output']
+            stats.update(input=input_path, output='-' if to_stdout else output_path, success=success,
+                         message=message, elapsed=time.perf_counter() - job_start)
+            if success and to_stdout:
+                with open(output_path, 'rb') as f:
+                    shutil.copyfileobj(f, sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+            report(stats)
+    else:
+        for result in compress_batch(inputs, args.output, target_kb=args.target_kb, max_quality=args.max_quality,
+                                     min_quality=args.min_quality, workers=args.jobs, cache=cache,
+                                     trace_path=args.trace, formats=formats,
+                                     scale_min_quality=args.scale_min_quality, threads=args.threads,
+                                     max_memory_mb=args.max_memory_mb, predict=not args.no_predict):
+            report(result)
+
+    if args.json:
+        summary = dict(files=len(inputs), failed=failed, import_seconds=import_seconds,
+                       elapsed=time.perf_counter() - start)
+        print(json.dumps(dict(summary=summary), ensure_ascii=False), file=report_stream, flush=True)
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        # 不带参数时打开图形界面，只有这时才导入 tkinter 等界面模块
+        from 图片压缩界面 import main as gui_main
+        gui_main()
+        return 0
+    return run_cli(argv)
+
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    
-    # 设置图标（如果存在）
-    try:
-        # 检测当前运行环境（打包后还是开发环境）
-        if getattr(sys, 'frozen', False):
-            # 打包后的可执行文件路径
-            base_path = os.path.dirname(sys.executable)
-        else:
-            # 开发环境脚本路径
-            base_path = os.path.dirname(os.path.abspath(__file__))
-        
-        # 尝试加载图标
-        icon_path = os.path.join(base_path, "app_icon.ico")
-        if os.path.exists(icon_path):
-            root.iconbitmap(icon_path)
-    except Exception as e:
-        print(f"加载图标失败: {e}")
-    
-    app = ImageCompressorApp(root)
-    root.mainloop()
+    # 打包成exe后多进程批量压缩需要，未打包时跳过以节省启动时间
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,557 @@
+import os
+import time
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+import threading
+import sys
+import multiprocessing
+
+# 压缩模块和 PIL 导入较慢，窗口显示后再在后台导入，见 get_cache
+from 任务通道 import JobChannel
+
+# 预览缩略图金字塔最大一级的边长
+PREVIEW_MAX_SIZE = 2048
+# 预览金字塔最小一级的边长
+PREVIEW_MIN_SIZE = 64
+# 窗口大小停止变化多久后再重绘预览(毫秒)
+PREVIEW_DEBOUNCE_MS = 150
+# 界面处理后台事件的间隔(毫秒)
+UI_TICK_MS = 100
+
+class ImageCompressorApp:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("图片压缩工具")
+        self.root.geometry("650x750")  # 增加窗口大小
+        self.root.resizable(True, True)
+        self.root.minsize(600, 500)  # 设置最小尺寸
+        
+        # 设置图标（如果存在）
+        self.set_icon()
+        
+        # 创建UI
+        self.create_widgets()
+        
+        # 初始化变量
+        self.input_path = ""
+        self.output_path = ""
+        self.compression_thread = None
+        self.channel = None  # 当前任务的事件通道
+        self.batch_dir = ""
+        self.cache = None
+        self.cache_loaded = False
+        self.cache_lock = threading.Lock()
+        self.preview_levels = []  # 预览缩略图金字塔，从大到小
+        self.preview_generation = 0  # 每次选择新图片加1，丢弃过期的后台加载结果
+        self.preview_resize_job = None
+        
+        # 窗口显示后在后台导入压缩模块并创建缓存，第一次压缩时不用再等
+        self.root.after(UI_TICK_MS, lambda: threading.Thread(target=self.get_cache, daemon=True).start())
+        
+    def get_cache(self):
+        """
+        压缩结果缓存，第一次调用时导入压缩模块(连同 PIL)并创建
+        缓存目录不可用时返回None，不使用缓存
+        """
+        with self.cache_lock:
+            if not self.cache_loaded:
+                from 图片压缩 import CompressionCache
+                try:
+                    self.cache = CompressionCache()
+                except OSError:
+                    self.cache = None
+                self.cache_loaded = True
+            return self.cache
+        
+    def set_icon(self):
+        """尝试设置应用图标"""
+        try:
+            # 尝试从可执行文件所在目录加载图标
+            if getattr(sys, 'frozen', False):
+                base_path = os.path.dirname(sys.executable)
+            else:
+                base_path = os.path.dirname(os.path.abspath(__file__))
+                
+            icon_path = os.path.join(base_path, "app_icon.ico")
+            if os.path.exists(icon_path):
+                self.root.iconbitmap(icon_path)
+        except Exception:
+            pass
+        
+    def create_widgets(self):
+        # 创建主框架
+        main_frame = ttk.Frame(self.root, padding=15)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # 文件选择部分
+        file_frame = ttk.LabelFrame(main_frame, text="文件选择", padding=10)
+        file_frame.pack(fill=tk.X, pady=5)
+        
+        # 输入文件
+        input_frame = ttk.Frame(file_frame)
+        input_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(input_frame, text="源文件:", width=8).pack(side=tk.LEFT)
+        self.input_entry = ttk.Entry(input_frame)
+        self.input_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        ttk.Button(input_frame, text="浏览...", command=self.browse_input, width=8).pack(side=tk.RIGHT)
+        
+        # 输出文件
+        output_frame = ttk.Frame(file_frame)
+        output_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(output_frame, text="输出文件:", width=8).pack(side=tk.LEFT)
+        self.output_entry = ttk.Entry(output_frame)
+        self.output_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        ttk.Button(output_frame, text="浏览...", command=self.browse_output, width=8).pack(side=tk.RIGHT)
+        
+        # 压缩设置
+        settings_frame = ttk.LabelFrame(main_frame, text="压缩设置", padding=10)
+        settings_frame.pack(fill=tk.X, pady=10)
+        
+        # 目标大小设置
+        target_frame = ttk.Frame(settings_frame)
+        target_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(target_frame, text="目标大小 (KB):", width=15).pack(side=tk.LEFT)
+        self.target_var = tk.IntVar(value=500)
+        ttk.Entry(target_frame, textvariable=self.target_var, width=10).pack(side=tk.LEFT, padx=5)
+        
+        # 质量设置
+        quality_frame = ttk.Frame(settings_frame)
+        quality_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(quality_frame, text="最高质量:", width=15).pack(side=tk.LEFT)
+        self.max_quality_var = tk.IntVar(value=85)
+        quality_scale = ttk.Scale(
+            quality_frame, 
+            from_=70, 
+            to=100, 
+            variable=self.max_quality_var,
+            orient=tk.HORIZONTAL,
+            length=200
+        )
+        quality_scale.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        ttk.Label(quality_frame, textvariable=self.max_quality_var, width=3).pack(side=tk.LEFT, padx=(0, 5))
+        
+        # 预览区域
+        preview_frame = ttk.LabelFrame(main_frame, text="图片预览", padding=10)
+        preview_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        
+        # 创建画布用于预览
+        self.preview_canvas = tk.Canvas(preview_frame, bg='#f0f0f0', height=250)
+        self.preview_canvas.pack(fill=tk.BOTH, expand=True)
+        
+        # 预览占位文本
+        self.preview_text = self.preview_canvas.create_text(
+            150, 100, 
+            text="选择图片后将显示预览",
+            font=("Arial", 10),
+            fill="#999999"
+        )
+        
+        # 绑定画布大小变化事件，只绑定一次
+        self.preview_canvas.bind("<Configure>", self.on_preview_configure)
+        
+        # 进度条
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.pack(fill=tk.X, pady=10)
+        
+        self.progress_var = tk.IntVar()
+        self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, maximum=100)
+        self.progress_bar.pack(fill=tk.X, expand=True)
+        
+        # 状态信息
+        self.status_var = tk.StringVar(value="准备就绪")
+        status_label = ttk.Label(main_frame, textvariable=self.status_var)
+        status_label.pack(fill=tk.X, pady=(0, 10))
+        
+        # 操作按钮
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=10)
+        
+        # 使用grid布局按钮以确保正确显示
+        self.start_btn = ttk.Button(button_frame, text="开始压缩", command=self.start_compression, width=15)
+        self.start_btn.grid(row=0, column=0, padx=5)
+        self.batch_btn = ttk.Button(button_frame, text="批量压缩...", command=self.start_batch_compression, width=15)
+        self.batch_btn.grid(row=0, column=1, padx=5)
+        self.cancel_btn = ttk.Button(button_frame, text="取消", command=self.cancel_compression, width=10)
+        self.cancel_btn.grid(row=0, column=2, padx=5)
+        self.cancel_btn.state(['disabled'])
+        ttk.Button(button_frame, text="打开输出文件夹", command=self.open_output_dir, width=15).grid(row=0, column=3, padx=5)
+        ttk.Button(button_frame, text="退出", command=self.root.quit, width=10).grid(row=0, column=4, padx=5)
+        
+        # 配置列权重，使按钮居中
+        for column in range(5):
+            button_frame.columnconfigure(column, weight=1)
+        
+    def browse_input(self):
+        file_path = filedialog.askopenfilename(
+            title="选择源图片",
+            filetypes=[
+                ("图片文件", "*.jpg *.jpeg *.png *.bmp *.gif *.webp"),
+                ("所有文件", "*.*")
+            ]
+        )
+        if file_path:
+            self.input_path = file_path
+            self.input_entry.delete(0, tk.END)
+            self.input_entry.insert(0, file_path)
+            
+            # 自动生成输出路径
+            dir_name, file_name = os.path.split(file_path)
+            name, ext = os.path.splitext(file_name)
+            self.output_path = os.path.join(dir_name, f"{name}_compressed{ext}")
+            self.output_entry.delete(0, tk.END)
+            self.output_entry.insert(0, self.output_path)
+            
+            # 显示预览
+            self.show_preview(file_path)
+    
+    def show_preview(self, file_path):
+        """显示图片预览，解码和生成缩略图在后台线程中进行"""
+        # 清除之前的预览
+        self.preview_canvas.delete("preview")
+        self.preview_canvas.itemconfig(self.preview_text, text="正在加载预览...")
+        self.preview_levels = []
+        self.preview_generation += 1
+        
+        threading.Thread(
+            target=self.load_preview,
+            args=(file_path, self.preview_generation),
+            daemon=True
+        ).start()
+    
+    def load_preview(self, file_path, generation):
+        """在后台线程中解码图片并生成缩略图金字塔"""
+        try:
+            from PIL import Image
+            img = Image.open(file_path)
+            width, height = img.size
+            
+            # JPEG 用 draft 模式直接以接近预览的尺寸解码，不解码原尺寸
+            img.draft('RGB', (PREVIEW_MAX_SIZE, PREVIEW_MAX_SIZE))
+            if img.mode not in ('RGB', 'RGBA', 'L'):
+                img = img.convert('RGBA' if 'transparency' in img.info or img.mode.endswith('A') else 'RGB')
+            img.thumbnail((PREVIEW_MAX_SIZE, PREVIEW_MAX_SIZE), Image.LANCZOS, reducing_gap=2.0)
+            
+            # 逐级减半，每一级由上一级生成
+            levels = [img]
+            while min(levels[-1].size) >= PREVIEW_MIN_SIZE * 2:
+                levels.append(levels[-1].reduce(2))
+            
+            file_size = os.path.getsize(file_path) / 1024
+            self.root.after(0, lambda: self.preview_loaded(generation, levels, width, height, file_size))
+        except Exception as e:
+            message = str(e)
+            self.root.after(0, lambda: self.preview_failed(generation, message))
+    
+    def preview_loaded(self, generation, levels, width, height, file_size):
+        if generation != self.preview_generation:
+            return
+        self.preview_levels = levels
+        self.preview_canvas.itemconfig(self.preview_text, text="")
+        self.status_var.set(f"已加载图片: {width}×{height} 分辨率, 大小: {file_size:.1f}KB")
+        self.render_preview()
+    
+    def preview_failed(self, generation, message):
+        if generation != self.preview_generation:
+            return
+        self.preview_canvas.itemconfig(self.preview_text, text=f"无法加载预览: {message}")
+        self.status_var.set(f"加载预览失败: {message}")
+    
+    def on_preview_configure(self, event):
+        """画布大小变化时延迟重绘，拖动窗口边缘期间只在停止后重绘一次"""
+        if self.preview_resize_job is not None:
+            self.root.after_cancel(self.preview_resize_job)
+        self.preview_resize_job = self.root.after(PREVIEW_DEBOUNCE_MS, self.render_preview)
+    
+    def render_preview(self):
+        """从缓存的金字塔中最接近的一级缩放到画布大小并显示"""
+        self.preview_resize_job = None
+        if not self.preview_levels:
+            return
+        from PIL import Image, ImageTk
+            
+        canvas_width = self.preview_canvas.winfo_width()
+        canvas_height = self.preview_canvas.winfo_height()
+        
+        if canvas_width < 10 or canvas_height < 10:
+            canvas_width, canvas_height = 300, 250
+        
+        largest = self.preview_levels[0]
+        ratio = min(canvas_width/largest.width, canvas_height/largest.height)
+        new_size = (max(1, int(largest.width * ratio)), max(1, int(largest.height * ratio)))
+        
+        # 选不小于目标尺寸的最小一级
+        source = largest
+        for level in reversed(self.preview_levels):
+            if level.width >= new_size[0] and level.height >= new_size[1]:
+                source = level
+                break
+        img = source.resize(new_size, Image.LANCZOS)
+        
+        # 将图像转换为PhotoImage
+        photo = ImageTk.PhotoImage(img)
+        
+        # 在画布中央显示图像
+        self.preview_canvas.delete("preview")
+        self.preview_canvas.image = photo  # 保持引用
+        self.preview_canvas.create_image(
+            canvas_width//2, 
+            canvas_height//2, 
+            image=photo, 
+            anchor=tk.CENTER,
+            tags="preview"
+        )
+    
+    def browse_output(self):
+        if not self.input_path:
+            messagebox.showerror("错误", "请先选择源文件")
+            return
+            
+        initial_dir, initial_file = os.path.split(self.output_path if self.output_path else self.input_path)
+        file_path = filedialog.asksaveasfilename(
+            title="保存压缩图片",
+            initialdir=initial_dir,
+            initialfile=initial_file,
+            filetypes=[
+                ("JPEG文件", "*.jpg"),
+                ("PNG文件", "*.png"),
+                ("WebP文件", "*.webp"),
+                ("所有文件", "*.*")
+            ]
+        )
+        if file_path:
+            self.output_path = file_path
+            self.output_entry.delete(0, tk.END)
+            self.output_entry.insert(0, file_path)
+    
+    def set_busy(self, busy):
+        """任务运行期间禁用开始按钮、启用取消按钮"""
+        state = ['disabled'] if busy else ['!disabled']
+        self.start_btn.state(state)
+        self.batch_btn.state(state)
+        self.cancel_btn.state(['!disabled'] if busy else ['disabled'])
+        self.root.config(cursor="watch" if busy else "")
+    
+    def read_settings(self):
+        """
+        在界面线程中读取压缩设置，后台线程不访问 Tk 变量
+        :return: (目标大小KB, 最高质量)，输入无效时提示错误并返回None
+        """
+        try:
+            target_kb = self.target_var.get()
+            max_quality = self.max_quality_var.get()
+        except tk.TclError:
+            target_kb = max_quality = 0
+        if target_kb <= 0:
+            messagebox.showerror("错误", "请输入有效的目标大小(KB)")
+            return None
+        return target_kb, max_quality
+    
+    def start_compression(self):
+        if not self.input_path or not os.path.exists(self.input_path):
+            messagebox.showerror("错误", "请选择有效的源文件")
+            return
+            
+        if not self.output_path:
+            messagebox.showerror("错误", "请指定输出文件路径")
+            return
+        
+        settings = self.read_settings()
+        if settings is None:
+            return
+            
+        # 禁用按钮避免重复点击
+        self.set_busy(True)
+        self.batch_dir = ""
+        
+        # 重置进度
+        self.progress_var.set(0)
+        self.status_var.set("开始压缩...")
+        
+        # 在新线程中执行压缩，通过事件通道汇报进度
+        self.channel = JobChannel()
+        self.compression_thread = threading.Thread(
+            target=self.run_compression,
+            args=(self.input_path, self.output_path) + settings + (self.channel,),
+            daemon=True
+        )
+        self.compression_thread.start()
+        
+        # 按固定间隔处理后台事件
+        self.poll_events()
+    
+    def run_compression(self, input_path, output_path, target_kb, max_quality, channel):
+        # 无论是否出错都要发出 finished，界面才会退出忙碌状态
+        success, message = False, "处理过程中出错"
+        try:
+            from 图片压缩 import compress_image
+            
+            def progress_callback(progress, message, done=False):
+                channel.progress(progress=progress, message=message)
+            
+            success, message = compress_image(
+                input_path, 
+                output_path,
+                target_kb=target_kb,
+                max_quality=max_quality,
+                progress_callback=progress_callback,
+                workers=min(4, os.cpu_count() or 1),
+                cache=self.get_cache(),
+                cancel=channel.cancel_event
+            )
+        except Exception as e:
+            message = f"处理过程中出错: {str(e)}"
+        finally:
+            channel.finish(kind='single', success=success, message=message, cancelled=channel.cancelled)
+    
+    def start_batch_compression(self):
+        settings = self.read_settings()
+        if settings is None:
+            return
+        source_dir = filedialog.askdirectory(title="选择要批量压缩的文件夹")
+        if not source_dir:
+            return
+            
+        from 图片压缩 import collect_images
+        inputs = collect_images(source_dir)
+        if not inputs:
+            messagebox.showerror("错误", "所选文件夹中没有图片")
+            return
+            
+        # 输出到源文件夹下的 compressed 子文件夹，避免下次批量时重复处理
+        self.batch_dir = os.path.join(source_dir, "compressed")
+        
+        self.set_busy(True)
+        self.progress_var.set(0)
+        self.status_var.set(f"开始批量压缩 {len(inputs)} 个文件...")
+        
+        # 子进程也要能看到取消标记
+        self.channel = JobChannel(multiprocessing.Event())
+        self.compression_thread = threading.Thread(
+            target=self.run_batch_compression,
+            args=(inputs, self.batch_dir) + settings + (self.channel,),
+            daemon=True
+        )
+        self.compression_thread.start()
+        self.poll_events()
+    
+    def run_batch_compression(self, inputs, output_dir, target_kb, max_quality, channel):
+        # 无论是否出错都要发出 finished，界面才会退出忙碌状态
+        outcome = dict(kind='batch', success=False, message="批量压缩出错", cancelled=False)
+        try:
+            from 图片压缩 import compress_batch
+            total = len(inputs)
+            done = failed = 0
+            original_bytes = compressed_bytes = 0
+            start = time.perf_counter()
+            
+            for result in compress_batch(inputs, output_dir, target_kb=target_kb, max_quality=max_quality,
+                                         cache=self.get_cache(), cancel=channel.cancel_event):
+                done += 1
+                if result['success']:
+                    original_bytes += os.path.getsize(result['input'])
+                    compressed_bytes += result['size'] or 0
+                else:
+                    failed += 1
+                message = (f"批量压缩: {done}/{total}, 失败 {failed}, "
+                           f"最近: {os.path.basename(result['input'])} {result['message']}")
+                channel.progress(progress=int(done / total * 100), message=message)
+            
+            title = "批量压缩已取消" if channel.cancelled else "批量压缩完成"
+            summary = (f"{title}!\n\n"
+                       f"成功: {total - failed} 个, 失败: {failed} 个\n"
+                       f"总大小: {original_bytes / 1024:.1f} KB -> {compressed_bytes / 1024:.1f} KB\n"
+                       f"耗时: {time.perf_counter() - start:.1f} 秒\n"
+                       f"输出文件夹: {output_dir}")
+            outcome.update(success=True, message=title, title=title, summary=summary)
+        except Exception as e:
+            outcome['message'] = f"批量压缩出错: {str(e)}"
+        finally:
+            channel.finish(**outcome)
+    
+    def cancel_compression(self):
+        if self.channel is not None and not self.channel.finished:
+            self.channel.cancel()
+            self.cancel_btn.state(['disabled'])
+            self.status_var.set("正在取消...")
+    
+    def poll_events(self):
+        """处理后台任务的事件，进度只显示最新的状态"""
+        channel = self.channel
+        for kind, data in channel.drain():
+            if kind == 'progress':
+                self.progress_var.set(data['progress'])
+                self.status_var.set(data['message'])
+            elif kind == 'finished':
+                self.set_busy(False)
+                if not data['success']:
+                    self.compression_failed(data['message'], data['cancelled'])
+                elif data['kind'] == 'batch':
+                    self.batch_complete(data['title'], data['summary'])
+                else:
+                    self.compression_complete(data['message'])
+        if not channel.finished:
+            self.root.after(UI_TICK_MS, self.poll_events)
+    
+    def batch_complete(self, title, summary):
+        self.progress_var.set(100)
+        self.status_var.set(summary.splitlines()[2])
+        messagebox.showinfo(title, summary)
+    
+    def compression_complete(self, message):
+        self.progress_var.set(100)
+        self.status_var.set(message)
+        
+        # 显示结果
+        if os.path.exists(self.output_path):
+            size_kb = os.path.getsize(self.output_path) / 1024
+            messagebox.showinfo("压缩成功", 
+                               f"图片压缩完成!\n\n"
+                               f"输出文件: {os.path.basename(self.output_path)}\n"
+                               f"最终大小: {size_kb:.2f} KB")
+    
+    def compression_failed(self, message, cancelled=False):
+        self.status_var.set(message)
+        if not cancelled:
+            messagebox.showerror("压缩失败", message)
+    
+    def open_output_dir(self):
+        if self.batch_dir and os.path.exists(self.batch_dir):
+            os.startfile(self.batch_dir)
+        elif self.output_path and os.path.exists(self.output_path):
+            output_dir = os.path.dirname(self.output_path)
+            os.startfile(output_dir)
+        elif self.input_path:
+            input_dir = os.path.dirname(self.input_path)
+            os.startfile(input_dir)
+        else:
+            messagebox.showerror("错误", "没有可用的输出目录")
+
+
+def main():
+    root = tk.Tk()
+    
+    # 设置图标（如果存在）
+    try:
+        # 检测当前运行环境（打包后还是开发环境）
+        if getattr(sys, 'frozen', False):
+            # 打包后的可执行文件路径
+            base_path = os.path.dirname(sys.executable)
+        else:
+            # 开发环境脚本路径
+            base_path = os.path.dirname(os.path.abspath(__file__))
+        
+        # 尝试加载图标
+        icon_path = os.path.join(base_path, "app_icon.ico")
+        if os.path.exists(icon_path):
+            root.iconbitmap(icon_path)
+    except Exception as e:
+        print(f"加载图标失败: {e}")
+    
+    app = ImageCompressorApp(root)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    # 打包成exe后多进程批量压缩需要
+    multiprocessing.freeze_support()
+    main()
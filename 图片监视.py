@@ -0,0 +1,234 @@
+"""
+监视文件夹，自动压缩新放入或有变化的图片
+
+用法:
+    python 图片监视.py 收件箱 -o 输出文件夹 -t 200
+    python 图片监视.py 收件箱 --once          # 处理完当前文件后退出
+
+处理过的文件(路径、修改时间、大小、内容哈希、结果)记录在状态数据库中，
+重启后不会重复处理；文件内容不变只是修改时间变化时也会跳过。
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from 图片压缩 import IMAGE_EXTENSIONS, batch_output_path, compress_image
+
+# 状态数据库的默认文件名，放在监视的文件夹中
+STATE_FILE = '.compress_state.db'
+
+
+def file_hash(path):
+    """文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _watch_job(input_path, output_path, known_hash, options):
+    """
+    在子进程中处理一个文件，内容哈希与上次成功处理时相同则跳过压缩
+    :param known_hash: 上次成功处理时的哈希，没有时为None
+    :return: 可序列化的结果字典
+    """
+    start = time.perf_counter()
+    digest = file_hash(input_path)
+    if digest == known_hash:
+        return dict(input=input_path, output=output_path, hash=digest, status='done', success=True,
+                    message="内容未变化，跳过", elapsed=time.perf_counter() - start)
+    stats = {}
+    success, message = compress_image(input_path, output_path, stats=stats, **options)
+    return dict(input=input_path, output=stats.get('output', output_path), hash=digest,
+                status='done' if success else 'failed', success=success, message=message,
+                elapsed=time.perf_counter() - start)
+
+
+class WatchState:
+    """
+    已处理文件的状态数据库(SQLite)
+    每个文件一行: 路径、修改时间、大小、内容哈希、状态(done/failed)、输出路径和结果说明
+    只在监视线程中使用
+    """
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, mtime REAL, size INTEGER, hash TEXT, status TEXT, output TEXT, '
+            'message TEXT, updated REAL)'
+        )
+        self.conn.commit()
+
+    def get(self, path):
+        """:return: (修改时间, 大小, 哈希, 状态)，没有记录时返回None"""
+        return self.conn.execute('SELECT mtime, size, hash, status FROM files WHERE path = ?', (path,)).fetchone()
+
+    def record(self, path, mtime, size, digest, status, output, message):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO files (path, mtime, size, hash, status, output, message, updated) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (path, mtime, size, digest, status, output, message, time.time())
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class FolderWatcher:
+    """
+    轮询监视文件夹，把新的或有变化的图片交给有上限的进程池压缩
+    - 文件大小和修改时间在连续两次扫描中不变才处理，避免处理还在复制中的文件
+    - 正在处理的文件数达到 max_pending 时不再提交新文件(背压)，留到下次扫描
+    - 处理结果写入 WatchState，重启后已处理且未变化的文件直接跳过
+    轮询不依赖平台的文件通知机制，在网络共享文件夹上同样可用
+    """
+    def __init__(self, inbox, output_dir=None, state_path=None, workers=None, max_pending=None,
+                 interval=2.0, on_result=None, **options):
+        """
+        :param inbox: 监视的文件夹(不含子文件夹)
+        :param output_dir: 输出文件夹，默认为 inbox 下的 compressed 子文件夹
+        :param state_path: 状态数据库路径，默认为 inbox 下的 STATE_FILE
+        :param workers: 进程数，默认为CPU核数
+        :param max_pending: 同时提交给进程池的文件数上限，默认为进程数的两倍
+        :param interval: 扫描间隔(秒)
+        :param on_result: 每处理完一个文件调用一次，参数为结果字典
+        :param options: 传给 compress_image 的参数，如 target_kb、max_quality
+        """
+        self.inbox = os.path.abspath(inbox)
+        self.output_dir = output_dir or os.path.join(self.inbox, 'compressed')
+        self.state_path = state_path or os.path.join(self.inbox, STATE_FILE)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 2
+        self.interval = interval
+        self.on_result = on_result
+        self.options = options
+        self.stop_event = threading.Event()
+        # 上次扫描时每个文件的 (修改时间, 大小)，用于判断文件是否已写完
+        self._last_seen = {}
+
+    def scan(self, state, busy):
+        """
+        扫描一次文件夹
+        :param busy: 正在处理的路径
+        :return: (需要处理的 [(路径, 修改时间, 大小, 上次成功处理时的哈希)], 还在变化、下次扫描再判断的文件数)
+        """
+        ready = []
+        unsettled = 0
+        seen = {}
+        with os.scandir(self.inbox) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                    continue
+                st = entry.stat()
+                seen[entry.path] = (st.st_mtime, st.st_size)
+                if entry.path in busy:
+                    continue
+                row = state.get(entry.path)
+                if row is not None and (row[0], row[1]) == seen[entry.path]:
+                    continue
+                if self._last_seen.get(entry.path) != seen[entry.path]:
+                    unsettled += 1
+                    continue
+                # 上次处理失败的文件即使内容未变也要重新压缩
+                known_hash = row[2] if row is not None and row[3] == 'done' else None
+                ready.append((entry.path, st.st_mtime, st.st_size, known_hash))
+        self._last_seen = seen
+        return sorted(ready), unsettled
+
+    def run(self, once=False):
+        """
+        开始监视，直到调用 stop()
+        :param once: 为True时处理完当前已有的文件后返回
+        :return: 处理的文件数
+        """
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+        os.makedirs(self.output_dir, exist_ok=True)
+        state = WatchState(self.state_path)
+        processed = 0
+        pending = {}
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                while not self.stop_event.is_set():
+                    ready, unsettled = self.scan(state, {job[0] for job in pending.values()})
+                    for path, mtime, size, known_hash in ready[:self.max_pending - len(pending)]:
+                        output_path = batch_output_path(path, self.output_dir)
+                        future = executor.submit(_watch_job, path, output_path, known_hash, self.options)
+                        pending[future] = (path, mtime, size)
+                    if once and not pending and not unsettled:
+                        break
+
+                    # 等待处理结果，没有正在处理的文件时等到下次扫描
+                    if not pending:
+                        self.stop_event.wait(self.interval)
+                        continue
+                    done, _ = wait(pending, timeout=self.interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path, mtime, size = pending.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            result = dict(input=path, output=None, hash=None, status='failed', success=False,
+                                          message=f"处理过程中出错: {str(e)}", elapsed=0.0)
+                        state.record(path, mtime, size, result['hash'], result['status'], result['output'],
+                                     result['message'])
+                        processed += 1
+                        if self.on_result:
+                            self.on_result(result)
+                for future in pending:
+                    future.cancel()
+        finally:
+            state.close()
+        return processed
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="监视文件夹，自动压缩新放入或有变化的图片")
+    parser.add_argument('inbox', help="监视的文件夹")
+    parser.add_argument('-o', '--output', help="输出文件夹，默认为监视文件夹下的 compressed")
+    parser.add_argument('-t', '--target-kb', type=int, default=500, help="目标大小(KB)，默认500")
+    parser.add_argument('--max-quality', type=int, default=85, help="起始质量，默认85")
+    parser.add_argument('--min-quality', type=int, default=5, help="最低质量，默认5")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="进程数，默认为CPU核数")
+    parser.add_argument('--max-pending', type=int, default=None, help="同时处理的文件数上限，默认为进程数的两倍")
+    parser.add_argument('--interval', type=float, default=2.0, help="扫描间隔(秒)，默认2")
+    parser.add_argument('--state', default=None, help="状态数据库路径，默认在监视文件夹中")
+    parser.add_argument('--once', action='store_true', help="处理完当前已有的文件后退出")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if not os.path.isdir(args.inbox):
+        print(f"错误: 文件夹不存在: {args.inbox}", file=sys.stderr)
+        return 2
+
+    def report(result):
+        print(f"{result['input']}: {result['message']}", flush=True)
+
+    watcher = FolderWatcher(
+        args.inbox, args.output, args.state, workers=args.jobs, max_pending=args.max_pending,
+        interval=args.interval, on_result=report, target_kb=args.target_kb, max_quality=args.max_quality,
+        min_quality=args.min_quality
+    )
+    try:
+        watcher.run(once=args.once)
+    except KeyboardInterrupt:
+        watcher.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    sys.exit(main())
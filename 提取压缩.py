@@ -0,0 +1,201 @@
+"""
+把子文件夹中的文件提取到根目录，同时压缩其中的图片
+
+用法:
+    python 提取压缩.py 文件夹 -t 200
+    python 提取压缩.py 文件夹 -o 输出文件夹 -j 4
+
+提取和压缩在一次遍历中完成: 每移动一张图片就交给压缩进程池，移动文件和压缩图片同时进行。
+排队和正在压缩的图片数有上限，压缩跟不上时提取暂停等待，不会积压大量任务。
+只压缩从子文件夹中提取出来的图片，根目录中原有的图片不处理。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from 图片压缩 import (FORMAT_CHOICES, IMAGE_EXTENSIONS, _compress_job, _init_worker, batch_output_path,
+                  formats_from_arg)
+from 文件提取 import Journal, extract_tree, recover
+
+# 默认输出文件夹名，放在处理的文件夹中，提取时跳过
+OUTPUT_DIR = 'compressed'
+
+def extract_and_compress(root_dir, output_dir=None, target_kb=500, max_quality=85, min_quality=5, formats=None,
+                         cache=None, workers=None, max_pending=None, cancel=None, journal=None, skip_dirs=(),
+                         duplicates=None, dedupe='report'):
+    """
+    提取 root_dir 子文件夹中的文件，每移动一张图片就提交压缩
+    :param output_dir: 压缩结果的输出文件夹，默认为 root_dir 下的 compressed；在 root_dir 中时不提取其中的文件
+    :param target_kb: 目标大小(KB)
+    :param max_quality: 起始质量
+    :param min_quality: 最低质量
+    :param formats: 输出格式，含义同 compress_image
+    :param cache: 可选的 CompressionCache
+    :param workers: 压缩进程数，默认为CPU核数
+    :param max_pending: 排队和正在压缩的图片数上限，默认为进程数的两倍
+    :param cancel: 可选的 multiprocessing.Event，设置后停止提取，取消未开始的压缩，正在压缩的图片在下次编码前停止
+    :param journal: 可选的 Journal，含义同 extract_tree
+    :param skip_dirs: 不遍历的文件夹，含义同 extract_tree
+    :param duplicates: 重复文件，含义同 extract_tree
+    :param dedupe: 重复文件的处理方式，含义同 extract_tree
+    :return: 生成器，产出 extract_tree 的事件，以及每张图片压缩完成时的 ('compress', 结果字典)，
+             结果字典包含 input、output、success、message、original_size、size、elapsed
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    if output_dir is None:
+        output_dir = os.path.join(root_dir, OUTPUT_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    skip_dirs = set(skip_dirs)
+    try:
+        relative = os.path.relpath(os.path.abspath(output_dir), os.path.abspath(root_dir))
+    except ValueError:
+        # Windows 上不在同一个盘
+        relative = os.pardir
+    if relative.split(os.sep)[0] != os.pardir:
+        skip_dirs.add(os.path.join(root_dir, relative))
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+    # 正在压缩的 {future: (输入路径, 输出路径, 原大小)}
+    pending = {}
+
+    def collect(timeout):
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            input_path, output_path, original_size = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                # 已取消或子进程异常退出等情况
+                message = "已取消压缩" if future.cancelled() else f"处理过程中出错: {str(e)}"
+                result = dict(input=input_path, output=output_path, success=False, message=message, size=None,
+                              elapsed=0.0)
+            result['original_size'] = original_size
+            yield 'compress', result
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cancel,)) as executor:
+        for event in extract_tree(root_dir, cancel=cancel, journal=journal, skip_dirs=skip_dirs,
+                                  duplicates=duplicates, dedupe=dedupe):
+            yield event
+            if event[0] == 'move' and event[2].lower().endswith(IMAGE_EXTENSIONS):
+                # 压缩跟不上时在这里等待，提取随之暂停
+                while len(pending) >= max_pending:
+                    yield from collect(None)
+                output_path = batch_output_path(event[2], output_dir)
+                future = executor.submit(_compress_job, event[2], output_path, target_kb, max_quality, min_quality,
+                                         cache, None, formats)
+                pending[future] = (event[2], output_path, os.path.getsize(event[2]))
+            if pending:
+                yield from collect(0)
+
+        while pending:
+            # 定时醒来检查取消标记
+            if cancel is not None and cancel.is_set():
+                for future in pending:
+                    future.cancel()
+            yield from collect(0.2)
+
+
+class PipelineSummary:
+    """提取和压缩的合计结果，逐个加入 extract_and_compress 的事件"""
+    def __init__(self):
+        self.moved = 0
+        self.removed = 0
+        self.duplicates = 0
+        self.compressed = 0
+        self.failed = 0
+        self.original_bytes = 0
+        self.compressed_bytes = 0
+        self.start = time.perf_counter()
+
+    def add(self, event):
+        if event[0] == 'move':
+            self.moved += 1
+        elif event[0] == 'remove':
+            self.removed += 1
+        elif event[0] == 'duplicate':
+            self.duplicates += 1
+        elif event[1]['success']:
+            self.compressed += 1
+            self.original_bytes += event[1]['original_size']
+            self.compressed_bytes += event[1]['size']
+        else:
+            self.failed += 1
+
+    def as_dict(self):
+        return dict(moved=self.moved, removed=self.removed, duplicates=self.duplicates,
+                    compressed=self.compressed, failed=self.failed, original_bytes=self.original_bytes,
+                    compressed_bytes=self.compressed_bytes, elapsed=time.perf_counter() - self.start)
+
+    def __str__(self):
+        lines = [f"移动了 {self.moved} 个文件，删除了 {self.removed} 个空文件夹"]
+        if self.duplicates:
+            lines.append(f"发现 {self.duplicates} 个重复文件")
+        lines.append(f"压缩了 {self.compressed} 张图片: {self.original_bytes / 1024 / 1024:.1f}MB -> "
+                     f"{self.compressed_bytes / 1024 / 1024:.1f}MB")
+        if self.failed:
+            lines.append(f"{self.failed} 张图片压缩失败")
+        lines.append(f"用时 {time.perf_counter() - self.start:.1f} 秒")
+        return "\n".join(lines)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="把子文件夹中的文件提取到根目录，同时压缩其中的图片")
+    parser.add_argument('folder', help="要处理的文件夹")
+    parser.add_argument('-o', '--output', help="压缩结果的输出文件夹，默认为处理的文件夹下的 compressed")
+    parser.add_argument('-t', '--target-kb', type=int, default=500, help="目标大小(KB)，默认500")
+    parser.add_argument('--max-quality', type=int, default=85, help="起始质量，默认85")
+    parser.add_argument('--min-quality', type=int, default=5, help="最低质量，默认5")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="压缩进程数，默认为CPU核数")
+    parser.add_argument('--max-pending', type=int, default=None, help="排队和正在压缩的图片数上限，默认为进程数的两倍")
+    parser.add_argument('--format', choices=FORMAT_CHOICES, default='keep',
+                        help="输出格式，含义同 图片压缩.py")
+    parser.add_argument('--json', action='store_true', help="每张图片输出一行JSON结果，最后输出一行汇总")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import multiprocessing
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if not os.path.isdir(args.folder):
+        print(f"错误: 文件夹不存在: {args.folder}", file=sys.stderr)
+        return 2
+
+    formats = formats_from_arg(args.format)
+    cancel = multiprocessing.Event()
+    summary = PipelineSummary()
+    # 与图形界面共用操作记录，中断后再次运行会继续处理，也可以在界面中撤销
+    resumed, kept = recover(args.folder)
+    journal = Journal(args.folder, fresh=not resumed)
+    complete = False
+    try:
+        for event in extract_and_compress(
+                args.folder, args.output, workers=args.jobs, max_pending=args.max_pending, cancel=cancel,
+                journal=journal, skip_dirs=kept, target_kb=args.target_kb, max_quality=args.max_quality,
+                min_quality=args.min_quality, formats=formats):
+            summary.add(event)
+            if event[0] != 'compress':
+                continue
+            if args.json:
+                print(json.dumps(event[1], ensure_ascii=False), flush=True)
+            else:
+                print(f"{event[1]['input']}: {event[1]['message']}", flush=True)
+        complete = True
+    except KeyboardInterrupt:
+        cancel.set()
+    finally:
+        journal.close(complete=complete)
+
+    if args.json:
+        print(json.dumps(dict(summary=summary.as_dict()), ensure_ascii=False), flush=True)
+    else:
+        print(summary)
+    return 1 if summary.failed or not complete else 0
+
+
+if __name__ == '__main__':
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,742 @@
+"""
+文件提取的核心逻辑，不依赖图形界面
+"""
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# 跨设备复制时默认同时进行的复制数
+IO_WORKERS = 4
+# 操作记录文件名，放在目标文件夹中
+JOURNAL_FILE = '.extract_journal.jsonl'
+# 查找重复文件时先比较开头和结尾各一块的哈希，块大小(字节)
+HASH_BLOCK = 64 * 1024
+# 对重复文件的处理方式
+DEDUPE_POLICIES = ('report', 'skip', 'hardlink')
+# renameat2 的参数: 相对当前目录解析路径、目标已存在时失败
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+
+
+class NameIndex:
+    """
+    目标文件夹中已占用文件名的内存索引
+    建立时列一次目录，之后为每个文件选名字都不再访问文件系统；
+    每个文件名记录下一个可用的 _N 序号，大量同名文件时也不会从 _1 开始逐个试
+    文件名按 os.path.normcase 比较，与 Windows 上不区分大小写的文件系统一致
+    """
+    def __init__(self, root_dir):
+        with os.scandir(root_dir) as entries:
+            self.names = {os.path.normcase(entry.name) for entry in entries}
+        # 文件名 -> 下一个尝试的序号
+        self.next_counter = {}
+
+    def reserve(self, filename):
+        """
+        为 filename 选一个未占用的名字并登记为已占用
+        冲突时依次使用 name_1.ext、name_2.ext ...，与原来的命名规则相同
+        """
+        key = os.path.normcase(filename)
+        if key not in self.names:
+            self.names.add(key)
+            return filename
+        base, ext = os.path.splitext(filename)
+        counter = self.next_counter.get(key, 1)
+        while True:
+            candidate = f"{base}_{counter}{ext}"
+            counter += 1
+            if os.path.normcase(candidate) not in self.names:
+                break
+        self.next_counter[key] = counter
+        self.names.add(os.path.normcase(candidate))
+        return candidate
+
+
+_renameat2 = None
+
+
+def _rename_noreplace(src, dest):
+    """
+    用 Linux 的 renameat2(RENAME_NOREPLACE) 原子地重命名，目标已存在时抛出 FileExistsError
+    :return: 系统或文件系统不支持时返回 False
+    """
+    global _renameat2
+    import ctypes
+    if _renameat2 is None:
+        _renameat2 = False
+        if sys.platform.startswith('linux'):
+            try:
+                func = ctypes.CDLL(None, use_errno=True).renameat2
+            except (AttributeError, OSError):
+                pass
+            else:
+                func.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint)
+                _renameat2 = func
+    if not _renameat2:
+        return False
+    if _renameat2(AT_FDCWD, os.fsencode(src), AT_FDCWD, os.fsencode(dest), RENAME_NOREPLACE) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+        return False
+    raise OSError(err, os.strerror(err), src, None, dest)
+
+
+def _rename_same_device(src, dest, created=None):
+    """
+    在不支持硬链接的文件系统(vfat、exFAT、部分网络共享)上不复制数据地移动文件
+    优先用 renameat2(RENAME_NOREPLACE)；不可用时先独占创建占位文件，再用 os.rename 替换它
+    :return: 跨设备等无法重命名时返回 False，目标已存在时抛出 FileExistsError
+    """
+    try:
+        if _rename_noreplace(src, dest):
+            return True
+    except FileExistsError:
+        raise
+    except OSError:
+        return False
+    os.close(os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+    try:
+        if created is not None:
+            created()
+        os.rename(src, dest)
+    except OSError:
+        os.unlink(dest)
+        return False
+    except BaseException:
+        os.unlink(dest)
+        raise
+    return True
+
+
+def move_no_replace(src, dest, created=None):
+    """
+    移动文件，目标已存在时抛出 FileExistsError，不会覆盖
+    Windows 上 os.rename 本身不覆盖；其他系统先建硬链接(目标存在时原子地失败)再删除源文件，
+    不支持硬链接时在同一设备内重命名；跨设备时先独占创建目标文件再复制，副本 fsync 后才删除源文件
+    :param created: 可选的回调，独占创建目标之后、重命名或复制之前调用
+    """
+    if os.name == 'nt':
+        try:
+            os.rename(src, dest)
+            return
+        except FileExistsError:
+            raise
+        except OSError:
+            pass
+    else:
+        try:
+            os.link(src, dest, follow_symlinks=False)
+            os.unlink(src)
+            return
+        except FileExistsError:
+            raise
+        except OSError as e:
+            link_errno = e.errno
+        if link_errno != errno.EXDEV and _rename_same_device(src, dest, created):
+            return
+
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dest)
+        if created is not None:
+            created()
+    else:
+        # O_EXCL 保证目标不存在时才创建，之后复制内容到这个占位文件
+        os.close(os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+        try:
+            if created is not None:
+                created()
+            shutil.copyfile(src, dest)
+            # 删除源文件前确认副本已落盘；复制权限等元数据之前目标仍然可写
+            with open(dest, 'r+b') as f:
+                os.fsync(f.fileno())
+            shutil.copystat(src, dest)
+        except BaseException:
+            os.unlink(dest)
+            raise
+    _sync_dir(os.path.dirname(os.path.abspath(dest)))
+    os.unlink(src)
+
+
+def _copy_data(src_fd, dest_fd, size):
+    """
+    在两个文件描述符之间复制 size 字节
+    优先用 copy_file_range(数据不经过用户态，部分文件系统还能在服务器端完成复制)，
+    不支持时用 sendfile，都不可用时按块读写
+    """
+    copied = 0
+    for name in ('copy_file_range', 'sendfile'):
+        if not hasattr(os, name):
+            continue
+        try:
+            while copied < size:
+                count = min(size - copied, 1 << 30)
+                if name == 'copy_file_range':
+                    sent = os.copy_file_range(src_fd, dest_fd, count, copied, copied)
+                else:
+                    os.lseek(dest_fd, copied, os.SEEK_SET)
+                    sent = os.sendfile(dest_fd, src_fd, copied, count)
+                if sent == 0:
+                    break
+                copied += sent
+            return copied
+        except OSError as e:
+            # 内核或文件系统不支持时换下一种方式，从已复制的位置继续
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                               errno.EBADF, errno.EPERM):
+                raise
+    os.lseek(src_fd, copied, os.SEEK_SET)
+    os.lseek(dest_fd, copied, os.SEEK_SET)
+    while True:
+        chunk = os.read(src_fd, 1024 * 1024)
+        if not chunk:
+            return copied
+        os.write(dest_fd, chunk)
+        copied += len(chunk)
+
+
+def _sync_dir(path):
+    """fsync 目录，使其中新建的文件名落盘；Windows 不能打开目录，部分网络文件系统不支持，都跳过"""
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def copy_no_replace(src, dest, created=None):
+    """
+    跨设备移动一个普通文件: 独占创建目标、复制内容和元数据(修改时间、权限等)、
+    确认大小一致并把目标文件和所在目录 fsync 到磁盘后才删除源文件，断电时不会两边都丢失；
+    目标已存在时抛出 FileExistsError，失败时删除不完整的目标
+    :param created: 可选的回调，独占创建目标之后、复制之前调用
+    :return: (源路径, 目标路径)
+    """
+    dest_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        try:
+            if created is not None:
+                created()
+            src_fd = os.open(src, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+            try:
+                size = os.fstat(src_fd).st_size
+                copied = _copy_data(src_fd, dest_fd, size)
+            finally:
+                os.close(src_fd)
+            os.fsync(dest_fd)
+        finally:
+            os.close(dest_fd)
+        shutil.copystat(src, dest)
+        if copied != size or os.path.getsize(dest) != size:
+            raise OSError(errno.EIO, f"复制后大小不一致: {copied} / {size}", src)
+        _sync_dir(os.path.dirname(os.path.abspath(dest)))
+    except BaseException:
+        os.unlink(dest)
+        raise
+    os.unlink(src)
+    return src, dest
+
+
+def link_duplicate(original, src, dest, root_dir, index):
+    """
+    用指向 original 的硬链接代替移动 src: 在 dest 建立硬链接后删除 src，相同的内容只保存一份，跨设备时也不用复制
+    dest 已被占用时换 index 分配的下一个名字；文件系统不支持硬链接时抛出 OSError，src 保持不变
+    :return: 目标路径
+    """
+    while True:
+        try:
+            os.link(original, dest)
+            break
+        except FileExistsError:
+            dest = os.path.join(root_dir, index.reserve(os.path.basename(src)))
+    os.unlink(src)
+    return dest
+
+
+def _subdirectories(path):
+    """path 下的子文件夹(不含指向文件夹的符号链接)"""
+    with os.scandir(path) as entries:
+        return [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+
+
+def count_files(root_dir, extensions=None):
+    """
+    统计子文件夹中需要移动的文件数，用于显示进度
+    只读目录项，利用 DirEntry 缓存的类型信息，不对每个文件 stat
+    :param extensions: 可选的小写扩展名元组，给出时只统计这些类型的文件
+    """
+    count = 0
+    stack = _subdirectories(root_dir)
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif not entry.is_dir() and (extensions is None or entry.name.lower().endswith(extensions)):
+                    count += 1
+    return count
+
+
+def _partial_hash(path, size):
+    """文件开头和结尾各一块的哈希；不超过两块的文件就是完整内容的哈希"""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        if size <= 2 * HASH_BLOCK:
+            digest.update(f.read())
+        else:
+            digest.update(f.read(HASH_BLOCK))
+            f.seek(-HASH_BLOCK, os.SEEK_END)
+            digest.update(f.read(HASH_BLOCK))
+    return digest.hexdigest()
+
+
+def _full_hash(path, size):
+    """完整内容的哈希，size 未使用，只为与 _partial_hash 的参数一致"""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+
+def find_duplicates(root_dir, skip_dirs=(), cancel=None, workers=IO_WORKERS):
+    """
+    查找 root_dir 及其子文件夹中内容相同的文件
+    先按大小分组，大小相同的比较开头和结尾各一块的哈希，仍然相同且文件超过两块时才计算完整哈希；
+    哈希在线程池中并行计算，读文件时不占用 GIL。符号链接、空文件和读不了的文件不参与比较
+    :param skip_dirs: 不遍历的文件夹，与 extract_tree 的同名参数一致
+    :param cancel: 可选的取消标记，设置后尽快结束并返回空字典
+    :param workers: 同时计算哈希的线程数
+    :return: {文件路径: 内容标识}，只包含至少有一个重复的文件，标识相同的文件内容相同
+    """
+    by_size = {}
+    with os.scandir(root_dir) as entries:
+        stack = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.path not in skip_dirs:
+                    stack.append(entry.path)
+            elif entry.is_file(follow_symlinks=False) and entry.name != JOURNAL_FILE:
+                by_size.setdefault(entry.stat(follow_symlinks=False).st_size, []).append(entry.path)
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path not in skip_dirs:
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    by_size.setdefault(entry.stat(follow_symlinks=False).st_size, []).append(entry.path)
+
+    def hashed(hash_func, path, size):
+        if cancel is not None and cancel.is_set():
+            return None
+        try:
+            return hash_func(path, size)
+        except OSError:
+            return None
+
+    def regroup(groups, hash_func, executor):
+        # 对每组中的文件计算哈希，按 (原标识, 哈希) 重新分组，只保留仍有重复的组
+        jobs = [(key, path) for key, paths in groups.items() for path in paths]
+        digests = executor.map(lambda job: hashed(hash_func, job[1], job[0][0]), jobs)
+        result = {}
+        for (key, path), digest in zip(jobs, digests):
+            if digest is not None:
+                result.setdefault((key[0], digest), []).append(path)
+        return {key: paths for key, paths in result.items() if len(paths) > 1}
+
+    groups = {(size, ''): paths for size, paths in by_size.items() if size > 0 and len(paths) > 1}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        groups = regroup(groups, _partial_hash, executor)
+        # 超过两块的文件部分哈希只比较了首尾，再比较完整内容
+        large = {key: paths for key, paths in groups.items() if key[0] > 2 * HASH_BLOCK}
+        for key in large:
+            del groups[key]
+        groups.update(regroup(large, _full_hash, executor))
+    if cancel is not None and cancel.is_set():
+        return {}
+    return {path: f"{size}:{digest}" for (size, digest), paths in groups.items() for path in paths}
+
+
+class Journal:
+    """
+    只追加的操作记录，用于中断后继续处理和撤销
+    每行一条 JSON 记录:
+      plan    即将移动 src -> dest，每个文件夹的计划在移动前一次写入并 fsync(预写日志)
+      created 需要复制时，目标文件已由本次处理独占创建，recover 只清理有这条记录的目标
+      done    移动完成，按批 fsync，崩溃时丢失的最后几条由 recover 根据文件是否存在补齐
+      rmdir   删除了空文件夹
+      kept    文件夹处理完但保留(如含有指向文件夹的链接)，继续处理时不再遍历
+      end     本次处理全部完成
+    """
+    def __init__(self, root_dir, fresh=True, sync_every=1000, sync_interval=1.0):
+        """
+        :param fresh: 为True时清空旧记录开始新的处理，为False时接着上次未完成的记录写
+        :param sync_every: 累计多少条完成记录后 fsync 一次
+        :param sync_interval: 距上次 fsync 超过多少秒后，下一条完成记录时 fsync
+        """
+        self.path = os.path.join(root_dir, JOURNAL_FILE)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._file = open(self.path, 'w' if fresh else 'a', encoding='utf-8')
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        # created 记录在复制线程中写入
+        self._lock = threading.Lock()
+
+    def _write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def plan(self, moves):
+        """记录一批即将进行的移动并立即落盘，之后才能开始移动"""
+        for src, dest in moves:
+            self._write({'op': 'plan', 'src': src, 'dest': dest})
+        self.sync()
+
+    def created(self, src, dest):
+        self._write({'op': 'created', 'src': src, 'dest': dest})
+
+    def done(self, src, dest):
+        self._write({'op': 'done', 'src': src, 'dest': dest})
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def removed(self, path):
+        self._write({'op': 'rmdir', 'path': path})
+
+    def kept(self, path):
+        self._write({'op': 'kept', 'path': path})
+
+    def sync(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self, complete=False):
+        """:param complete: 处理是否全部完成，是则写入 end 记录"""
+        if complete:
+            self._write({'op': 'end'})
+        self.sync()
+        self._file.close()
+
+
+def read_journal(root_dir):
+    """
+    读取操作记录，崩溃时写了一半的最后一行会被忽略
+    :return: 记录列表，没有记录文件时为空列表
+    """
+    path = os.path.join(root_dir, JOURNAL_FILE)
+    records = []
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def _finished_moves(records):
+    """由记录得到已完成的移动 [(src, dest)]，按完成顺序"""
+    moves = []
+    planned = {}
+    for record in records:
+        if record['op'] == 'plan':
+            planned[record['src']] = record['dest']
+        elif record['op'] == 'done':
+            planned.pop(record['src'], None)
+            moves.append((record['src'], record['dest']))
+    # 只有计划没有完成记录的: 目标存在而源不存在说明已经移动，只是完成记录还没落盘
+    for src, dest in planned.items():
+        if os.path.lexists(dest) and not os.path.lexists(src):
+            moves.append((src, dest))
+    return moves
+
+
+def recover(root_dir):
+    """
+    检查上次未完成的处理，补齐中断时正在进行的移动
+    计划中的源和目标都存在时，只处理能确定是同一次移动的:
+      源和目标是同一个文件(建立硬链接后、删除源文件前中断)，删除源文件；
+      目标有 created 记录(本次处理创建后开始复制)，大小相同时说明复制完成，删除源文件，否则删除不完整的目标
+    其他情况目标可能是之后放入的无关文件，两个都保留，继续处理时源文件换名字移动
+    :return: (是否有未完成的处理, 上次保留的文件夹集合)；上次已全部完成时返回 (False, set())
+    """
+    records = read_journal(root_dir)
+    if not records or records[-1]['op'] == 'end':
+        return False, set()
+    finished = {src for src, _ in _finished_moves(records)}
+    created = {(record['src'], record['dest']) for record in records if record['op'] == 'created'}
+    for record in records:
+        if record['op'] != 'plan' or record['src'] in finished:
+            continue
+        src, dest = record['src'], record['dest']
+        try:
+            src_stat, dest_stat = os.lstat(src), os.lstat(dest)
+        except FileNotFoundError:
+            continue
+        if os.path.samestat(src_stat, dest_stat):
+            os.unlink(src)
+        elif (src, dest) in created:
+            if os.path.islink(dest) or src_stat.st_size == dest_stat.st_size:
+                os.unlink(src)
+            else:
+                os.unlink(dest)
+    return True, {record['path'] for record in records if record['op'] == 'kept'}
+
+
+def undo_journal(root_dir):
+    """
+    按操作记录撤销上次处理: 按相反顺序把文件移回原位置，重新创建删除的文件夹
+    :return: 生成器，依次产出 ('restore', 当前路径, 原路径) 或 ('mkdir', 文件夹路径)；全部完成后删除记录文件
+    """
+    records = read_journal(root_dir)
+    for record in reversed(records):
+        if record['op'] == 'rmdir' and not os.path.isdir(record['path']):
+            os.makedirs(record['path'], exist_ok=True)
+            yield 'mkdir', record['path']
+    for src, dest in reversed(_finished_moves(records)):
+        if not os.path.lexists(dest):
+            continue
+        os.makedirs(os.path.dirname(src), exist_ok=True)
+        move_no_replace(dest, src)
+        yield 'restore', dest, src
+    try:
+        os.unlink(os.path.join(root_dir, JOURNAL_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def extract_tree(root_dir, index=None, cancel=None, io_workers=IO_WORKERS, journal=None, dry_run=False,
+                 skip_dirs=(), duplicates=None, dedupe='report'):
+    """
+    一次遍历把子文件夹中的文件全部移动到 root_dir，同时删除变空的文件夹
+    每个文件夹只列一次目录，用 DirEntry 缓存的类型信息区分文件和文件夹，
+    记录每个文件夹剩下的条目数，文件夹的内容处理完且没有剩余时立即删除，不再重新列目录
+    指向文件夹的符号链接保留在原处，与 os.walk 不跟随链接的行为一致
+    与 root_dir 在同一设备上的文件直接重命名；其他设备(挂载点等)上的文件交给线程池并行复制，
+    复制完成并确认后才删除源文件，这些文件所在的文件夹在全部复制完成后再尝试删除
+    列出一个文件夹后先为其中所有文件分配目标名字，写入 journal 后再开始移动
+    :param index: 可选的 NameIndex，默认按 root_dir 现有文件建立
+    :param cancel: 可选的取消标记，每个文件移动前检查，设置后等正在复制的文件完成后结束，尚未处理完的文件夹保留
+    :param io_workers: 跨设备复制的并发数
+    :param journal: 可选的 Journal，记录计划和完成的操作
+    :param dry_run: 为True时只读取目录、生成同样的事件，不移动也不删除任何东西
+    :param skip_dirs: 不遍历的文件夹(上次已处理完而保留的)
+    :param duplicates: 可选的 {文件路径: 内容标识}，由 find_duplicates 得到；
+                       每组内容相同的文件中，根目录已有的或最先移动的作为原文件，其余按 dedupe 处理
+    :param dedupe: 重复文件的处理方式: 'report' 照常移动并报告，'skip' 不移动、留在原文件夹，
+                   'hardlink' 在根目录建立指向原文件的硬链接并删除源文件(不支持硬链接时照常移动)
+    :return: 生成器，依次产出 ('move', 源路径, 目标路径)、('remove', 文件夹路径)
+             或 ('duplicate', 源路径, 目标路径, 原文件路径)，跳过的重复文件目标路径为 None
+    """
+    if index is None:
+        index = NameIndex(root_dir)
+    root_dev = os.stat(root_dir).st_dev
+    executor = None
+    # 正在复制的 {future: 源路径}
+    pending = {}
+    # 因为有文件在复制而没有删除的文件夹，按子文件夹在前的顺序
+    deferred = []
+    if duplicates is None:
+        duplicates = {}
+    # 内容标识 -> 原文件在根目录中的路径
+    placed = {}
+    root_key = os.path.dirname(os.path.join(root_dir, ''))
+    for path, key in duplicates.items():
+        if os.path.dirname(path) == root_key:
+            placed.setdefault(key, path)
+
+    def open_dir(path, cross_device):
+        # 列出目录并为其中的文件分配目标名字，一次写入计划
+        entries = _list_dir(path)
+        targets = {entry.path: os.path.join(root_dir, index.reserve(entry.name))
+                   for entry in entries if not entry.is_dir()}
+        if journal is not None and targets:
+            journal.plan(targets.items())
+        # [文件夹路径, 尚未处理的目录项, 剩下的条目数, 是否在其他设备上, {源路径: 目标路径}]
+        return [path, iter(entries), 0, cross_device, targets]
+
+    def moved(src, dest):
+        if journal is not None:
+            journal.done(src, dest)
+        return 'move', src, dest
+
+    def transfer(frame, entry):
+        # 移动一个文件(或符号链接)，重复文件按 dedupe 处理
+        original = placed.get(duplicates.get(entry.path))
+        dest = frame[4][entry.path]
+        if original and dedupe == 'skip':
+            frame[2] += 1
+            yield 'duplicate', entry.path, None, original
+            return
+        if original and dedupe == 'hardlink':
+            try:
+                if not dry_run:
+                    dest = link_duplicate(original, entry.path, dest, root_dir, index)
+            except OSError:
+                # 不支持硬链接时照常移动
+                pass
+            else:
+                yield moved(entry.path, dest)
+                yield 'duplicate', entry.path, dest, original
+                return
+
+        if dry_run:
+            yield 'move', entry.path, dest
+        elif frame[3] and not entry.is_symlink():
+            # 正在复制的文件过多时先等一部分完成
+            while len(pending) >= io_workers * 2:
+                yield from collect(block=True)
+            submit(entry.path, dest)
+            frame[2] += 1
+            return
+        else:
+            while True:
+                try:
+                    move_no_replace(entry.path, dest, created_callback(entry.path, dest))
+                    break
+                except FileExistsError:
+                    # 分配名字之后有其他程序创建了同名文件，换下一个名字
+                    dest = os.path.join(root_dir, index.reserve(entry.name))
+                    if journal is not None:
+                        journal.plan([(entry.path, dest)])
+            yield moved(entry.path, dest)
+        yield from place(entry.path, dest)
+
+    def place(src, dest):
+        # 登记移动到根目录的文件；同样内容已有原文件时报告为重复
+        key = duplicates.get(src)
+        if key is None:
+            return []
+        original = placed.setdefault(key, dest)
+        return [] if original == dest else [('duplicate', src, dest, original)]
+
+    def created_callback(src, dest):
+        # 需要复制时记录目标由本次处理创建，中断后 recover 据此清理
+        if journal is None:
+            return None
+        return lambda: journal.created(src, dest)
+
+    def submit(src, dest):
+        nonlocal executor
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=io_workers)
+        pending[executor.submit(copy_no_replace, src, dest, created_callback(src, dest))] = src
+
+    def collect(block=False):
+        # 取回已完成的复制，block 为True时至少等到一个完成
+        done = [future for future in pending if future.done()]
+        if block and not done:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        events = []
+        for future in done:
+            src = pending.pop(future)
+            try:
+                src, dest = future.result()
+                events.append(moved(src, dest))
+                events.extend(place(src, dest))
+            except FileExistsError:
+                # 复制期间目标位置出现了同名文件，换下一个名字
+                dest = os.path.join(root_dir, index.reserve(os.path.basename(src)))
+                if journal is not None:
+                    journal.plan([(src, dest)])
+                submit(src, dest)
+        return events
+
+    try:
+        # 先取出根目录下的子文件夹，之后移入根目录的文件不会被再次遍历
+        for top in _subdirectories(root_dir):
+            if top in skip_dirs:
+                continue
+            stack = [open_dir(top, os.stat(top).st_dev != root_dev)]
+            while stack:
+                if pending:
+                    yield from collect()
+                frame = stack[-1]
+                entry = next(frame[1], None)
+                if entry is None:
+                    stack.pop()
+                    removed = False
+                    if frame[2] == 0:
+                        try:
+                            if not dry_run:
+                                os.rmdir(frame[0])
+                            removed = True
+                        except OSError:
+                            # 处理期间有新文件放入等情况，保留文件夹
+                            pass
+                    if removed:
+                        if journal is not None:
+                            journal.removed(frame[0])
+                        yield 'remove', frame[0]
+                    else:
+                        if executor is not None:
+                            deferred.append(frame[0])
+                        elif journal is not None:
+                            journal.kept(frame[0])
+                        if stack:
+                            stack[-1][2] += 1
+                    continue
+
+                if cancel is not None and cancel.is_set():
+                    # 放弃尚未开始的复制，等正在复制的完成
+                    for future in list(pending):
+                        if future.cancel():
+                            del pending[future]
+                    while pending:
+                        yield from collect(block=True)
+                    return
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path in skip_dirs:
+                        frame[2] += 1
+                        continue
+                    cross_device = entry.stat(follow_symlinks=False).st_dev != root_dev
+                    stack.append(open_dir(entry.path, cross_device))
+                elif entry.is_dir():
+                    frame[2] += 1
+                else:
+                    yield from transfer(frame, entry)
+
+        while pending:
+            yield from collect(block=True)
+        # 复制全部完成后，删除因此变空的文件夹
+        for path in deferred:
+            try:
+                os.rmdir(path)
+            except OSError:
+                if journal is not None:
+                    journal.kept(path)
+                continue
+            if journal is not None:
+                journal.removed(path)
+            yield 'remove', path
+    finally:
+        if executor is not None:
+            # 取消或出错时也等正在复制的文件完成，不留下不完整的文件
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _list_dir(path):
+    """列出目录项，移动文件前先全部取出，避免边遍历边修改目录"""
+    with os.scandir(path) as entries:
+        return list(entries)
@@ -1,14 +1,36 @@
 import os
-import shutil
+import sys
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 
+from 任务通道 import JobChannel
+from 日志视图 import LogView, RotatingLogFile, default_log_dir
+from 文件提取 import Journal, count_files, extract_tree, find_duplicates, read_journal, recover, undo_journal
+
+# 界面处理后台事件的间隔(毫秒)，日志按这个间隔成批写入
+UI_TICK_MS = 100
+# 重复文件选项: 显示文字 -> extract_tree 的 dedupe 参数，None 表示不查找重复文件
+DEDUPE_CHOICES = {
+    "不检查": None,
+    "照常移动并报告": 'report',
+    "跳过(留在原文件夹)": 'skip',
+    "硬链接到已有文件": 'hardlink',
+}
+
 class FileExtractorApp:
     def __init__(self, root):
         self.root = root
         self.root.title("文件夹文件提取工具")
         self.root.geometry("600x400")
         
+        self.channel = None  # 当前任务的事件通道
+        # 完整日志写入文件，界面中只保留最近的部分；日志目录不可写时只在界面中显示
+        try:
+            self.log_file = RotatingLogFile(os.path.join(default_log_dir(), 'file_extractor.log'))
+        except OSError:
+            self.log_file = None
+        
         # 创建界面元素
         self.create_widgets()
         
@@ -24,8 +46,8 @@ class FileExtractorApp:
         
         使用方法：
         1. 点击"选择文件夹"按钮选择要处理的目录
-        2. 点击"开始处理"按钮执行文件提取
-        3. 处理完成后会显示处理结果
+        2. 点击"开始处理"按钮执行文件提取，"预览"只列出将要进行的操作
+        3. 处理完成后会显示处理结果，"撤销上次"可以把文件移回原位置
         """
         desc_label = tk.Label(self.root, text=desc_text, justify=tk.LEFT)
         desc_label.pack(pady=10, padx=20)
@@ -42,14 +64,31 @@ class FileExtractorApp:
         browse_btn = tk.Button(folder_frame, text="浏览", command=self.browse_folder)
         browse_btn.pack(side=tk.LEFT)
         
+        # 重复文件处理方式
+        dedupe_frame = tk.Frame(self.root)
+        dedupe_frame.pack(fill=tk.X, padx=20)
+        tk.Label(dedupe_frame, text="内容相同的文件:").pack(side=tk.LEFT)
+        self.dedupe_var = tk.StringVar(value="不检查")
+        ttk.Combobox(dedupe_frame, textvariable=self.dedupe_var, values=list(DEDUPE_CHOICES), state="readonly",
+                     width=18).pack(side=tk.LEFT, padx=5)
+        
+        # 提取的同时压缩图片，压缩模块较大，勾选后开始处理时才导入
+        self.compress_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(dedupe_frame, text="同时压缩图片到", variable=self.compress_var).pack(side=tk.LEFT, padx=(15, 0))
+        self.target_kb_var = tk.StringVar(value="500")
+        tk.Entry(dedupe_frame, textvariable=self.target_kb_var, width=6).pack(side=tk.LEFT)
+        tk.Label(dedupe_frame, text="KB").pack(side=tk.LEFT)
+        
         # 进度条
-        self.progress = ttk.Progressbar(self.root, mode='indeterminate')
-        self.progress.pack(pady=10, fill=tk.X, padx=20)
+        self.progress = ttk.Progressbar(self.root, mode='determinate')
+        self.progress.pack(pady=(10, 0), fill=tk.X, padx=20)
+        self.status_var = tk.StringVar()
+        tk.Label(self.root, textvariable=self.status_var, anchor=tk.W).pack(fill=tk.X, padx=20)
         
         # 日志区域
         tk.Label(self.root, text="操作日志:").pack(anchor=tk.W, padx=20)
-        self.log_text = tk.Text(self.root, height=10)
-        self.log_text.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
+        self.log_view = LogView(self.root, height=10)
+        self.log_view.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
         
         # 按钮区域
         button_frame = tk.Frame(self.root)
@@ -58,6 +97,15 @@ class FileExtractorApp:
         self.process_btn = tk.Button(button_frame, text="开始处理", command=self.process_files)
         self.process_btn.pack(side=tk.LEFT, padx=5)
         
+        self.preview_btn = tk.Button(button_frame, text="预览", command=lambda: self.process_files(dry_run=True))
+        self.preview_btn.pack(side=tk.LEFT, padx=5)
+        
+        self.undo_btn = tk.Button(button_frame, text="撤销上次", command=self.undo_last)
+        self.undo_btn.pack(side=tk.LEFT, padx=5)
+        
+        self.cancel_btn = tk.Button(button_frame, text="取消", command=self.cancel_processing, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
+        
         self.clear_btn = tk.Button(button_frame, text="清空日志", command=self.clear_log)
         self.clear_btn.pack(side=tk.LEFT, padx=5)
         
@@ -70,84 +118,220 @@ class FileExtractorApp:
             self.folder_path.set(folder_selected)
     
     def log_message(self, message):
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        """在界面线程中追加日志，多行可以一次写入，同一批日志只写一次文件"""
+        self.log_view.append(message)
+        if self.log_file is not None:
+            self.log_file.write(message.split("\n"))
     
     def clear_log(self):
-        self.log_text.delete(1.0, tk.END)
+        """只清空界面中的日志，日志文件不变"""
+        self.log_view.clear()
     
-    def process_files(self):
+    def get_target_dir(self):
         target_dir = self.folder_path.get()
         if not target_dir or not os.path.exists(target_dir):
             messagebox.showerror("错误", "请选择有效的文件夹路径！")
+            return None
+        return target_dir
+    
+    def set_busy(self, busy):
+        """任务运行期间禁用开始类按钮、启用取消按钮"""
+        state = tk.DISABLED if busy else tk.NORMAL
+        for button in (self.process_btn, self.preview_btn, self.undo_btn):
+            button.config(state=state)
+        self.cancel_btn.config(state=tk.NORMAL if busy else tk.DISABLED)
+    
+    def start_job(self, target, args, message, cancel_event=None):
+        # 在后台线程中处理，界面按固定间隔取回进度和日志
+        self.set_busy(True)
+        self.progress.config(value=0, maximum=1)
+        self.status_var.set("正在统计文件...")
+        self.log_message(message)
+        if self.log_file is not None:
+            self.log_message("完整日志: " + self.log_file.path)
+        self.channel = JobChannel(cancel_event)
+        threading.Thread(target=target, args=args + (self.channel,), daemon=True).start()
+        self.poll_events()
+    
+    def process_files(self, dry_run=False):
+        target_dir = self.get_target_dir()
+        if target_dir:
+            prefix = "预览文件夹(不会修改任何文件): " if dry_run else "开始处理文件夹: "
+            dedupe = DEDUPE_CHOICES[self.dedupe_var.get()]
+            target_kb = None
+            cancel_event = None
+            if self.compress_var.get() and not dry_run:
+                try:
+                    target_kb = int(self.target_kb_var.get())
+                except ValueError:
+                    target_kb = 0
+                if target_kb <= 0:
+                    messagebox.showerror("错误", "请输入有效的目标大小(KB)！")
+                    return
+                # 压缩在子进程中进行，取消标记需要子进程也能看到
+                import multiprocessing
+                cancel_event = multiprocessing.Event()
+            self.start_job(self.run_job, (target_dir, dry_run, dedupe, target_kb), prefix + target_dir,
+                           cancel_event)
+    
+    def undo_last(self):
+        target_dir = self.get_target_dir()
+        if not target_dir:
             return
-        
-        self.process_btn.config(state=tk.DISABLED)
-        self.progress.start()
-        self.log_message("开始处理文件夹: " + target_dir)
-        
+        if not read_journal(target_dir):
+            messagebox.showinfo("撤销", "该文件夹没有可以撤销的操作记录")
+            return
+        if messagebox.askyesno("撤销", "把上次处理移动的文件全部移回原位置？"):
+            self.start_job(self.run_undo, (target_dir,), "撤销上次处理: " + target_dir)
+    
+    def run_job(self, target_dir, dry_run, dedupe, target_kb, channel):
+        """
+        后台线程: 统计文件数，一次遍历移动文件并删除空文件夹，结果通过 channel 发回界面
+        target_kb 不为None时每移动一张图片就交给压缩进程池，进度包含移动和压缩两部分
+        """
+        moved_files = removed_dirs = duplicate_files = compressed_images = 0
+        journal = None
+        summary = None
+        mode = 'preview' if dry_run else 'extract'
         try:
-            # 收集所有文件并移动到目标目录
-            moved_files = self.move_files_to_root(target_dir)
+            total = count_files(target_dir)
+            if target_kb is not None:
+                from 提取压缩 import IMAGE_EXTENSIONS, PipelineSummary, extract_and_compress
+                summary = PipelineSummary()
+                total += count_files(target_dir, IMAGE_EXTENSIONS)
+            channel.progress(done=0, total=total)
             
-            # 删除空文件夹
-            removed_dirs = self.remove_empty_folders(target_dir)
+            kept = set()
+            if not dry_run:
+                # 上次中断时先补齐正在进行的移动，再接着记录
+                resumed, kept = recover(target_dir)
+                if resumed:
+                    channel.emit('log', message="发现上次未完成的处理，继续处理")
+                journal = Journal(target_dir, fresh=not resumed)
             
-            # 显示结果
-            self.log_message(f"处理完成！移动了 {moved_files} 个文件，删除了 {removed_dirs} 个空文件夹。")
-            messagebox.showinfo("完成", f"处理完成！\n移动了 {moved_files} 个文件\n删除了 {removed_dirs} 个空文件夹")
+            duplicates = None
+            if dedupe is not None:
+                channel.emit('log', message="正在查找内容相同的文件...")
+                duplicates = find_duplicates(target_dir, skip_dirs=kept, cancel=channel.cancel_event)
+                channel.emit('log', message=f"找到 {len(duplicates)} 个有重复内容的文件")
             
+            # 移动所有文件到目标目录，文件夹变空后立即删除；取消后未处理完的文件夹保留
+            verb = "将移动" if dry_run else "移动文件"
+            options = dict(cancel=channel.cancel_event, journal=journal, skip_dirs=kept, duplicates=duplicates,
+                           dedupe=dedupe or 'report')
+            if summary is not None:
+                events = extract_and_compress(target_dir, target_kb=target_kb, **options)
+            else:
+                events = extract_tree(target_dir, dry_run=dry_run, **options)
+            for event in events:
+                if summary is not None:
+                    summary.add(event)
+                if event[0] == 'compress':
+                    compressed_images += 1
+                    result = event[1]
+                    channel.emit('log', message=f"压缩图片: {os.path.basename(result['input'])}: {result['message']}")
+                    channel.progress(done=moved_files + compressed_images,
+                                     total=max(total, moved_files + compressed_images))
+                elif event[0] == 'duplicate':
+                    duplicate_files += 1
+                    action = "跳过" if event[2] is None else ("硬链接" if dedupe == 'hardlink' else "已移动")
+                    channel.emit('log', message=f"重复文件({action}): {os.path.relpath(event[1], target_dir)} "
+                                                f"与 {os.path.basename(event[3])} 内容相同")
+                elif event[0] == 'move':
+                    moved_files += 1
+                    channel.emit('log', message=f"{verb}: {os.path.relpath(event[1], target_dir)} -> "
+                                                f"{os.path.basename(event[2])}")
+                    channel.progress(done=moved_files + compressed_images,
+                                     total=max(total, moved_files + compressed_images))
+                else:
+                    removed_dirs += 1
+                    channel.emit('log', message=f"{'将删除' if dry_run else '删除空文件夹'}: "
+                                                f"{os.path.relpath(event[1], target_dir)}")
+            if journal is not None:
+                journal.close(complete=not channel.cancelled)
+            channel.finish(mode=mode, moved=moved_files, removed=removed_dirs, duplicates=duplicate_files,
+                           cancelled=channel.cancelled, error=None, summary=summary and str(summary))
         except Exception as e:
-            self.log_message(f"处理过程中发生错误: {str(e)}")
-            messagebox.showerror("错误", f"处理过程中发生错误: {str(e)}")
-        finally:
-            self.progress.stop()
-            self.process_btn.config(state=tk.NORMAL)
+            if journal is not None:
+                journal.close()
+            channel.finish(mode=mode, moved=moved_files, removed=removed_dirs, duplicates=duplicate_files,
+                           cancelled=False, error=str(e))
+    
+    def run_undo(self, target_dir, channel):
+        """后台线程: 按操作记录把文件移回原位置"""
+        restored = created = 0
+        try:
+            for event in undo_journal(target_dir):
+                if event[0] == 'restore':
+                    restored += 1
+                    channel.emit('log', message=f"移回: {os.path.basename(event[1])} -> "
+                                                f"{os.path.relpath(event[2], target_dir)}")
+                    channel.progress(done=restored, total=restored)
+                else:
+                    created += 1
+            channel.finish(mode='undo', moved=restored, removed=created, cancelled=False, error=None)
+        except Exception as e:
+            channel.finish(mode='undo', moved=restored, removed=created, cancelled=False, error=str(e))
+    
+    def cancel_processing(self):
+        if self.channel is not None and not self.channel.finished:
+            self.channel.cancel()
+            self.cancel_btn.config(state=tk.DISABLED)
+            self.status_var.set("正在取消...")
     
-    def move_files_to_root(self, root_dir):
-        count = 0
-        for foldername, subfolders, filenames in os.walk(root_dir):
-            # 跳过根目录本身
-            if foldername == root_dir:
-                continue
-                
-            for filename in filenames:
-                src_path = os.path.join(foldername, filename)
-                dest_path = os.path.join(root_dir, filename)
-                
-                # 处理文件名冲突
-                base, ext = os.path.splitext(filename)
-                counter = 1
-                while os.path.exists(dest_path):
-                    new_filename = f"{base}_{counter}{ext}"
-                    dest_path = os.path.join(root_dir, new_filename)
-                    counter += 1
-                
-                # 移动文件
-                shutil.move(src_path, dest_path)
-                self.log_message(f"移动文件: {filename} -> {os.path.basename(dest_path)}")
-                count += 1
-                
-        return count
+    def poll_events(self):
+        """处理后台事件: 进度只取最新的一条，本次取到的日志一次性写入"""
+        channel = self.channel
+        lines = []
+        for kind, data in channel.drain():
+            if kind == 'log':
+                lines.append(data['message'])
+            elif kind == 'progress':
+                self.progress.config(value=data['done'], maximum=max(1, data['total']))
+                self.status_var.set(f"已处理 {data['done']} / {data['total']} 个文件")
+            elif kind == 'finished':
+                if lines:
+                    self.log_message("\n".join(lines))
+                    lines = []
+                self.processing_complete(**data)
+        if lines:
+            self.log_message("\n".join(lines))
+        if not channel.finished:
+            self.root.after(UI_TICK_MS, self.poll_events)
     
-    def remove_empty_folders(self, root_dir):
-        count = 0
-        # 从最深层的文件夹开始删除
-        for foldername, subfolders, filenames in os.walk(root_dir, topdown=False):
-            # 跳过根目录
-            if foldername == root_dir:
-                continue
-                
-            # 如果文件夹为空，删除它
-            if not os.listdir(foldername):
-                os.rmdir(foldername)
-                self.log_message(f"删除空文件夹: {os.path.basename(foldername)}")
-                count += 1
-                
-        return count
+    def processing_complete(self, mode, moved, removed, cancelled, error, duplicates=0, summary=None):
+        self.set_busy(False)
+        if error is not None:
+            self.status_var.set("处理失败")
+            self.log_message(f"处理过程中发生错误: {error}")
+            messagebox.showerror("错误", f"处理过程中发生错误: {error}")
+        elif mode == 'preview':
+            self.status_var.set("预览完成")
+            self.log_message(f"预览完成！将移动 {moved} 个文件，删除 {removed} 个空文件夹，发现 {duplicates} 个重复文件。")
+        elif mode == 'undo':
+            self.status_var.set("撤销完成")
+            self.log_message(f"撤销完成！移回了 {moved} 个文件，重新创建了 {removed} 个文件夹。")
+            messagebox.showinfo("完成", f"撤销完成！\n移回了 {moved} 个文件")
+        elif cancelled:
+            self.status_var.set("已取消")
+            self.log_message(f"已取消！移动了 {moved} 个文件，删除了 {removed} 个空文件夹。再次开始处理会从中断处继续。")
+        else:
+            self.status_var.set("处理完成")
+            # 显示结果，同时压缩图片时显示提取和压缩的合计结果
+            if summary is not None:
+                self.log_message("处理完成！\n" + summary)
+                messagebox.showinfo("完成", "处理完成！\n" + summary)
+                return
+            self.log_message(f"处理完成！移动了 {moved} 个文件，删除了 {removed} 个空文件夹。")
+            if duplicates:
+                self.log_message(f"其中发现 {duplicates} 个重复文件。")
+            messagebox.showinfo("完成", f"处理完成！\n移动了 {moved} 个文件\n删除了 {removed} 个空文件夹")
 
 if __name__ == "__main__":
+    # 打包成exe后"同时压缩图片"的多进程压缩需要，未打包时跳过以节省启动时间
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
     root = tk.Tk()
     app = FileExtractorApp(root)
     root.mainloop()
@@ -0,0 +1,138 @@
+"""
+日志显示和日志文件
+LogView 只把可见的几行放进 Text 控件，RotatingLogFile 把完整日志按批写入按大小滚动的文件
+"""
+import collections
+import itertools
+import os
+import time
+import tkinter as tk
+import tkinter.font
+
+# 界面中保留的日志行数，更早的只在日志文件中
+MAX_LOG_LINES = 5000
+# 日志文件超过这个大小(字节)后滚动
+LOG_MAX_BYTES = 10 * 1024 * 1024
+# 保留的旧日志文件数
+LOG_BACKUPS = 3
+
+
+def default_log_dir():
+    """默认的日志目录"""
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'py-tool', 'logs')
+
+
+class LogView:
+    """
+    只渲染可见部分的日志控件
+    日志行保存在固定长度的环形缓冲区中，超过 max_lines 时丢弃最早的行；
+    Text 控件中只放当前可见的几行，追加日志和滚动的开销与总行数无关
+    滚动条在最底部时跟随最新日志，向上滚动后停在原处
+    """
+    def __init__(self, master, max_lines=MAX_LOG_LINES, height=10, **text_options):
+        self.frame = tk.Frame(master)
+        self.scrollbar = tk.Scrollbar(self.frame, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text = tk.Text(self.frame, height=height, wrap=tk.NONE, state=tk.DISABLED, **text_options)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.lines = collections.deque(maxlen=max_lines)
+        self.rows = height  # 可见行数
+        self.top = 0  # 第一行可见行在缓冲区中的位置
+        self.follow = True  # 是否跟随最新日志
+        self.line_height = tkinter.font.Font(font=self.text['font']).metrics('linespace')
+        self.text.bind('<Configure>', self.on_resize)
+        self.text.bind('<MouseWheel>', lambda event: self.scroll(-3 if event.delta > 0 else 3))
+        self.text.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.text.bind('<Button-5>', lambda event: self.scroll(3))
+
+    def pack(self, **options):
+        self.frame.pack(**options)
+
+    def append(self, message):
+        """追加一条或多条(用换行分隔)日志，多行可以一次加入"""
+        new_lines = message.split("\n")
+        # 缓冲区满时最早的行被挤掉，停在原处的视图随之前移
+        dropped = max(0, len(self.lines) + len(new_lines) - self.lines.maxlen)
+        self.lines.extend(new_lines)
+        self.top = max(0, self.top - dropped)
+        self.render()
+
+    def clear(self):
+        self.lines.clear()
+        self.top = 0
+        self.follow = True
+        self.render()
+
+    def scroll(self, delta):
+        """按行滚动，delta 为正时向下"""
+        self.top += delta
+        self.follow = False
+        self.render()
+        return "break"
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == tk.MOVETO:
+            self.top = int(float(value) * len(self.lines))
+            self.follow = False
+            self.render()
+        else:
+            self.scroll(int(value) * (self.rows if unit == tk.PAGES else 1))
+
+    def on_resize(self, event):
+        self.rows = max(1, event.height // self.line_height)
+        self.render()
+
+    def render(self):
+        last_top = max(0, len(self.lines) - self.rows)
+        if self.follow or self.top >= last_top:
+            self.top = last_top
+            self.follow = True
+        self.top = max(0, self.top)
+        visible = itertools.islice(self.lines, self.top, self.top + self.rows)
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(1.0, tk.END)
+        self.text.insert(tk.END, "\n".join(visible))
+        self.text.config(state=tk.DISABLED)
+        if self.lines:
+            self.scrollbar.set(self.top / len(self.lines), min(1.0, (self.top + self.rows) / len(self.lines)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+
+class RotatingLogFile:
+    """
+    按大小滚动的日志文件: path 超过 max_bytes 后改名为 path.1，原来的 path.1 改为 path.2，依此类推
+    每次 write 写入一批日志并 flush 一次，界面按固定间隔成批写入，不逐行访问磁盘
+    """
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self.size = self._file.tell()
+
+    def write(self, lines):
+        """写入一批日志行，每行加上时间"""
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        text = "".join(f"{stamp} {line}\n" for line in lines)
+        size = len(text.encode('utf-8'))
+        if self.size and self.size + size > self.max_bytes:
+            self.rotate()
+        self._file.write(text)
+        self._file.flush()
+        self.size += size
+
+    def rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self.size = 0
+
+    def close(self):
+        self._file.close()